@@ -0,0 +1,245 @@
+"""
+Search benchmark for chessAI.
+Searches the SUITE positions (openings, middlegames, endgames and mate puzzles) to a fixed depth or node count
+from empty tables and with the same root shuffle, so every run of the same code searches the same trees. Per
+position it reports the move found, nodes, seconds, nodes per second and the time each depth was reached,
+then a summary line with the number of puzzles solved (the move found is the puzzle's best). The node counts
+are a signature of the search: a change that isn't meant to change what is searched must leave them alone,
+the times catch speed regressions.
+A run can be saved as a JSON baseline and later runs compared with it. Changed node counts or moves are
+regressions and make the exit status 1. Saved times are only comparable on the machine they were taken on, so
+nodes per second are only checked when --tolerance is given: then dropping more than that below the baseline's
+is a regression too.
+The configuration mode switches the move ordering heuristics and then the selective search parts on one after
+the other and reports nodes, beta cutoffs and how many of the cutoffs came from the first move searched.
+Better ordering shows up as fewer nodes and a first move cutoff rate closer to 1.
+Usage:
+    python bench.py                         every position to depth 5, one JSON object per line
+    python bench.py --nodes 20000           stop every search after 20000 nodes instead
+    python bench.py --save-baseline benchBaseline.json
+    python bench.py --baseline benchBaseline.json
+    python bench.py --baseline mine.json --tolerance 0.1
+                                            also fail on 10% fewer nodes per second than mine.json
+    python bench.py --config all --depth 4  every configuration, one JSON object per configuration
+    python bench.py --profile counters      also count and time the hot functions, see engineProfile
+"""
+import argparse
+import json
+import random
+import sys
+
+import bitboardEngine
+import chessAI
+import engineProfile
+
+SUITE = [
+    {"kind": "opening", "name": "start position", "fen": bitboardEngine.START_FEN},
+    {"kind": "opening", "name": "1.e4", "fen": "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"},
+    {"kind": "opening", "name": "sicilian", "fen": "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2"},
+    {"kind": "opening", "name": "italian",
+     "fen": "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3"},
+    {"kind": "opening", "name": "ruy lopez",
+     "fen": "r1bqkbnr/pppp1ppp/2n5/1B2p3/4P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3"},
+    {"kind": "opening", "name": "french", "fen": "rnbqkbnr/ppp2ppp/4p3/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq d6 0 3"},
+    {"kind": "opening", "name": "caro-kann",
+     "fen": "rnbqkbnr/pp2pppp/2p5/3p4/3PP3/8/PPP2PPP/RNBQKBNR w KQkq d6 0 3"},
+    {"kind": "opening", "name": "queen's gambit declined",
+     "fen": "rnbqkb1r/ppp2ppp/4pn2/3p4/2PP4/2N5/PP2PPPP/R1BQKBNR w KQkq - 2 4"},
+    {"kind": "opening", "name": "king's indian",
+     "fen": "rnbqk2r/ppp1ppbp/3p1np1/8/2PPP3/2N5/PP3PPP/R1BQKBNR w KQkq - 0 5"},
+    {"kind": "opening", "name": "london",
+     "fen": "rnbqkb1r/ppp1pppp/5n2/3p4/3P1B2/5N2/PPP1PPPP/RN1QKB1R b KQkq - 3 3"},
+    {"kind": "middlegame", "name": "kiwipete",
+     "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"},
+    {"kind": "middlegame", "name": "symmetrical italian",
+     "fen": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10"},
+    {"kind": "middlegame", "name": "promotion captures",
+     "fen": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8"},
+    {"kind": "middlegame", "name": "closed ruy lopez",
+     "fen": "r1b2rk1/2q1bppp/p2p1n2/np2p3/3PP3/5N1P/PPBN1PP1/R1BQR1K1 w - - 0 13"},
+    {"kind": "middlegame", "name": "queen's gambit",
+     "fen": "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP2BPPP/R2QKB1R w KQ - 0 8"},
+    {"kind": "middlegame", "name": "yugoslav attack",
+     "fen": "r2q1rk1/pp2ppbp/2np1np1/8/3NP3/2N1BP2/PPPQ2PP/R3KB1R w KQ - 3 10"},
+    {"kind": "middlegame", "name": "dragon",
+     "fen": "2rq1rk1/pp1bppbp/2np1np1/8/3NP3/1BN1BP2/PPPQ2PP/2KR3R b - - 6 12"},
+    {"kind": "middlegame", "name": "giuoco pianissimo",
+     "fen": "r1bq1rk1/ppp2ppp/2np1n2/2b1p3/2B1P3/2PP1N2/PP3PPP/RNBQ1RK1 w - - 0 7"},
+    {"kind": "middlegame", "name": "open c-file",
+     "fen": "3r1rk1/p4ppp/1qp2n2/4p3/1P2P3/P1NQ4/2P2PPP/R4RK1 w - - 0 18"},
+    {"kind": "middlegame", "name": "game of the century",
+     "fen": "r3r1k1/pp3pbp/1qp3p1/2B5/2BP2b1/Q1n2N2/P4PPP/3R1K1R b - - 0 17"},
+    {"kind": "middlegame", "name": "queens exchanged",
+     "fen": "r1b2rk1/pp3ppp/2n1pn2/2b5/2B5/2N1PN2/PP3PPP/R1B2RK1 w - - 0 10"},
+    {"kind": "middlegame", "name": "opposite castling",
+     "fen": "r3k2r/pbpnqpp1/1p2pn1p/8/2PP4/P1N1PN2/1P1BQPPP/2KR3R b kq - 0 12"},
+    {"kind": "endgame", "name": "rook and pawns", "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"},
+    {"kind": "endgame", "name": "queens and pawns", "fen": "2r3k1/p4p2/3Rp2p/1p2P1pK/8/1P4P1/P3Q2P/1q6 b - - 0 1"},
+    {"kind": "endgame", "name": "king and pawn", "fen": "8/8/8/4k3/8/8/4P3/4K3 w - - 0 1"},
+    {"kind": "endgame", "name": "blocked b-pawns", "fen": "8/8/1p6/1P1k4/8/3K4/8/8 w - - 0 1"},
+    {"kind": "endgame", "name": "fine 70", "fen": "8/k7/3p4/p2P1p2/P2P1P2/8/8/K7 w - - 0 1"},
+    {"kind": "endgame", "name": "king and rook", "fen": "8/8/4k3/8/2R5/8/4K3/8 w - - 0 1"},
+    {"kind": "endgame", "name": "king and queen", "fen": "4k3/8/8/8/8/8/3Q4/4K3 w - - 0 1"},
+    {"kind": "endgame", "name": "bishop and knight", "fen": "8/3k4/8/2B5/8/8/3NK3/8 w - - 0 1"},
+    {"kind": "endgame", "name": "rook against pawns", "fen": "8/5pk1/6p1/7p/7P/6P1/5PK1/3R4 w - - 0 1"},
+    {"kind": "endgame", "name": "connected pawns", "fen": "8/8/8/3k4/8/8/2P1P3/4K3 w - - 0 1"},
+    {"kind": "endgame", "name": "active rook", "fen": "8/6pk/7p/8/8/6P1/5PKP/2r5 w - - 0 1"},
+    {"kind": "mate", "name": "back rank", "fen": "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1", "best": "a1a8"},
+    {"kind": "mate", "name": "scholar's mate",
+     "fen": "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4", "best": "h5f7"},
+    {"kind": "mate", "name": "queen on the back rank", "fen": "6k1/5ppp/8/8/8/8/1Q3PPP/6K1 w - - 0 1",
+     "best": "b2b8"},
+    {"kind": "mate", "name": "smothered", "fen": "6rk/6pp/8/6N1/8/8/8/6K1 w - - 0 1", "best": "g5f7"},
+    {"kind": "mate", "name": "legal's mate",
+     "fen": "r2qkb1r/pp2nppp/3p4/2pNN1B1/2BnP3/3P4/PPP2PPP/R2bK2R w KQkq - 1 10", "best": "d5f6"},
+    {"kind": "mate", "name": "morphy's rook sacrifice", "fen": "kbK5/pp6/1P6/8/8/8/8/R7 w - - 0 1", "best": "a1a6"},
+]
+
+# chessAI switches in the order the configurations turn them on
+SWITCHES = ["USE_HASH_MOVE", "USE_KILLERS", "USE_HISTORY", "USE_CHECK_EXTENSIONS", "USE_NULL_MOVE", "USE_LMR",
+            "USE_FUTILITY", "USE_RAZORING"]
+# (name, switches on), each one adds a switch to the one before
+CONFIGS = [(name, SWITCHES[:count]) for count, name in
+           enumerate(["mvv-lva only", "+ hash move", "+ killers", "+ history", "+ check extensions", "+ null move",
+                      "+ lmr", "+ futility", "+ razoring"])]
+
+
+def search_limits(depth, nodes):
+    return {"depth": chessAI.MAX_PLY - 1, "nodes": nodes} if nodes else {"depth": depth}
+
+
+"""
+Searches fen from empty tables, returns chessAI.stats of the search
+"""
+
+
+def run_position(fen, search_limits):
+    gs = bitboardEngine.GameState(fen)
+    random.seed(0)  # the root shuffle is part of the search, keep it the same for every run
+    chessAI.new_game()
+    chessAI.search(gs, gs.get_valid_moves(), search_limits)
+    return chessAI.stats
+
+
+def run_suite(depth, nodes, out=sys.stdout):
+    results = []
+    for position in SUITE:
+        stats = run_position(position["fen"], search_limits(depth, nodes))
+        result = {"name": position["name"], "kind": position["kind"], "move": stats.move, "score": stats.score,
+                  "depth": stats.depth, "nodes": stats.nodes + stats.qnodes, "seconds": round(stats.seconds, 4),
+                  "nps": stats.nps(), "time_to_depth": [round(seconds, 4) for _, seconds, _ in stats.iterations]}
+        if "best" in position:
+            result["solved"] = stats.move == position["best"]
+        results.append(result)
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+    total_nodes = sum(result["nodes"] for result in results)
+    seconds = sum(result["seconds"] for result in results)
+    summary = {"depth": depth, "node_limit": nodes, "positions": len(results),
+               "solved": sum(result.get("solved", False) for result in results),
+               "puzzles": sum("solved" in result for result in results), "nodes": total_nodes,
+               "seconds": round(seconds, 3), "nps": int(total_nodes / seconds) if seconds > 0 else 0}
+    out.write(json.dumps(summary) + "\n")
+    out.flush()
+    return {"summary": summary, "positions": results}
+
+
+"""
+Compares a run_suite result with a baseline one. Positions whose node count moved by more than node_tolerance
+(a fraction of the baseline's) or whose move changed are listed, and slower is set when nodes per second
+dropped by more than tolerance (never when tolerance is None). ok is False on any of them.
+"""
+
+
+def compare(run, baseline, tolerance, node_tolerance=0.0):
+    for key in ("depth", "node_limit"):
+        if run["summary"][key] != baseline["summary"][key]:
+            raise ValueError("the baseline was run with %s %s, not %s" % (key, baseline["summary"][key],
+                                                                          run["summary"][key]))
+    base_positions = {position["name"]: position for position in baseline["positions"]}
+    node_changes, move_changes = [], []
+    for position in run["positions"]:
+        base = base_positions.get(position["name"])
+        if base is None:  # added to the suite after the baseline was taken
+            continue
+        if abs(position["nodes"] - base["nodes"]) > node_tolerance * base["nodes"]:
+            node_changes.append({"name": position["name"], "nodes": position["nodes"], "baseline": base["nodes"]})
+        if position["move"] != base["move"]:
+            move_changes.append({"name": position["name"], "move": position["move"], "baseline": base["move"]})
+    nps, base_nps = run["summary"]["nps"], baseline["summary"]["nps"]
+    slower = tolerance is not None and nps < base_nps * (1 - tolerance)
+    return {"nps": nps, "baseline_nps": base_nps, "speed": round(nps / base_nps, 3) if base_nps else 0.0,
+            "slower": slower, "node_changes": node_changes, "move_changes": move_changes,
+            "ok": not (slower or node_changes or move_changes)}
+
+
+def run_config(config, depth, out=sys.stdout):
+    name, switches_on = config
+    for switch in SWITCHES:
+        setattr(chessAI, switch, switch in switches_on)
+    totals = {"nodes": 0, "cutoffs": 0, "first_move_cutoffs": 0, "seconds": 0.0}
+    for position in SUITE:
+        stats = run_position(position["fen"], {"depth": depth})
+        totals["nodes"] += stats.nodes + stats.qnodes
+        totals["cutoffs"] += stats.cutoffs
+        totals["first_move_cutoffs"] += stats.first_move_cutoffs
+        totals["seconds"] += stats.seconds
+    summary = {"config": name, "depth": depth, "positions": len(SUITE), "nodes": totals["nodes"],
+               "cutoffs": totals["cutoffs"],
+               "first_move_cutoff_rate": round(totals["first_move_cutoffs"] / totals["cutoffs"], 4)
+               if totals["cutoffs"] else 0.0,
+               "seconds": round(totals["seconds"], 3),
+               "nps": int(totals["nodes"] / totals["seconds"]) if totals["seconds"] > 0 else 0}
+    out.write(json.dumps(summary) + "\n")
+    out.flush()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fixed position search benchmark")
+    parser.add_argument("--depth", type=int, default=None, help="5, or 4 with --config")
+    parser.add_argument("--nodes", type=int, default=0, help="node limit per position instead of a depth")
+    parser.add_argument("--save-baseline", help="write the run to this JSON file")
+    parser.add_argument("--baseline", help="compare the run with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="fraction nodes per second may drop below the baseline's, unchecked when not given "
+                             "(only meaningful against a baseline taken on this machine)")
+    parser.add_argument("--node-tolerance", type=float, default=0.0,
+                        help="fraction a node count may differ from the baseline's")
+    parser.add_argument("--config", choices=["all"] + [config[0] for config in CONFIGS],
+                        help="compare move ordering and selective search configurations instead")
+    parser.add_argument("--profile", action="append", default=[], choices=engineProfile.MODES,
+                        help="profiling mode, can be given twice")
+    args = parser.parse_args(argv)
+    engineProfile.enable(args.profile)
+    if args.config:
+        saved = {switch: getattr(chessAI, switch) for switch in SWITCHES}
+        try:
+            for config in CONFIGS:
+                if args.config in ("all", config[0]):
+                    run_config(config, args.depth or 4)
+        finally:
+            for switch, value in saved.items():
+                setattr(chessAI, switch, value)
+        return 0
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if (baseline["summary"]["depth"], baseline["summary"]["node_limit"]) != (args.depth or 5, args.nodes):
+            parser.error("%s was run with --depth %s --nodes %s" % (args.baseline, baseline["summary"]["depth"],
+                                                                   baseline["summary"]["node_limit"]))
+    run = run_suite(args.depth or 5, args.nodes)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump(run, baseline_file, indent=1)
+            baseline_file.write("\n")
+    if baseline:
+        comparison = compare(run, baseline, args.tolerance, args.node_tolerance)
+        print(json.dumps(comparison))
+        return 0 if comparison["ok"] else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1293 @@
+"""
+Bitboard backed version of copyEngine.GameState.
+It keeps the same interface (board, whiteToMove, moveLog, get_valid_moves, make_move, undo_move, ...)
+so chessAI and copyMain can use it unchanged, but the position is stored as 12 piece bitboards plus
+occupancy masks and the legal moves are generated from precomputed attack tables.
+Square 0 is a8 and square 63 is h1, so square = row * 8 + col matches the 8x8 board rows and columns.
+Moves are plain ints (see encode_move), a copyEngine.Move is only built by to_move when the GUI needs one.
+Positions load from and export to FEN, and snapshot / from_snapshot pack one into a few dozen bytes
+for handing it to another process.
+"""
+import random
+import struct
+from array import array
+
+import pieceSquareTables
+from copyEngine import Move, CastleRights
+from magicBitboards import rook_attacks, bishop_attacks
+
+WHITE = 0
+BLACK = 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+EMPTY = 12  # value of an empty square in the squares list
+PIECE_NAMES = ("wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK")
+PIECE_INDEX = {name: index for index, name in enumerate(PIECE_NAMES)}
+FULL = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+
+UNDO_STACK_PLIES = 1024  # plies preallocated in the undo stack, it doubles if a game ever gets longer
+
+# castle rights bit mask
+WKS = 1
+WQS = 2
+BKS = 4
+BQS = 8
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_PIECES = "PNBRQKpnbrqk"  # FEN letter of every piece index
+FILES = "abcdefgh"
+
+"""
+Binary snapshot of a position, the hand-off format between the GUI and the search process:
+    32 bytes of squares (two per byte, low nibble first), side to move | castle rights << 1,
+    en passant square (255 for none), halfmove clock, fullmove number, number of history keys,
+    then the Zobrist keys of the earlier positions since the last capture or pawn move, oldest first.
+It stays a few dozen bytes however long the game has been going on.
+"""
+SNAPSHOT_HEADER = struct.Struct("<32sBBHHH")
+
+START_BOARD = [
+    ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
+    ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
+    ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
+]
+
+"""
+Packed move encoding, one int per move:
+    bits 0-5 start square, bits 6-11 end square, bits 12-15 flag,
+    bits 16-19 moved piece, bits 20-23 captured piece (EMPTY when nothing is captured)
+"""
+QUIET = 0
+DOUBLE_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8  # promotion flags are PROMOTION + (promoted piece type - KNIGHT), plus CAPTURE on a capture
+NULL_MOVE = 0  # a8 to a8, no real move looks like it, see GameState.make_null_move
+
+# what generate_legal_moves produces, captures include en passant and every promotion
+GEN_CAPTURES = 1
+GEN_QUIETS = 2
+GEN_ALL = GEN_CAPTURES | GEN_QUIETS
+
+
+def encode_move(start, end, flag, piece, captured=EMPTY):
+    return start | end << 6 | flag << 12 | piece << 16 | captured << 20
+
+
+def move_start(move):
+    return move & 63
+
+
+def move_end(move):
+    return move >> 6 & 63
+
+
+def move_flag(move):
+    return move >> 12 & 15
+
+
+def moved_piece(move):
+    return move >> 16 & 15
+
+
+def captured_piece(move):
+    return move >> 20 & 15
+
+
+def is_capture(move):
+    return move >> 12 & CAPTURE != 0
+
+
+def is_promotion(move):
+    return move >> 12 & PROMOTION != 0
+
+
+"""
+Capture ordering, most valuable victim first and then least valuable attacker (MVV-LVA).
+CAPTURE_ORDER is indexed by move >> 12 & 0xFFF (flag, moved piece and captured piece), every capture and
+promotion scores above 0 so quiet moves (score 0) always sort behind them. Underpromotions come last.
+"""
+ORDER_VALUES = (1, 3, 3, 5, 9, 0)  # the king never gets captured and costs nothing to attack with
+SEE_VALUES = (100, 300, 300, 500, 900, 20000)  # static exchange evaluation, in hundredths of a pawn
+
+
+def _capture_order_table():
+    table = [0] * 4096
+    for flag in range(16):
+        for piece in range(12):
+            for captured in range(13):
+                score = 0
+                if flag & CAPTURE and captured != EMPTY:
+                    score += 1000 + ORDER_VALUES[captured % 6] * 16 - ORDER_VALUES[piece % 6]
+                if flag & PROMOTION:
+                    score += 1000 + (ORDER_VALUES[QUEEN] - 1) * 16 if flag & 3 == QUEEN - KNIGHT else 500
+                table[flag | piece << 4 | captured << 8] = score
+    return table
+
+
+CAPTURE_ORDER = _capture_order_table()
+
+
+def capture_order(move):
+    return CAPTURE_ORDER[move >> 12 & 0xFFF]
+
+
+"""
+Builds a copyEngine.Move for display, animation and notation
+"""
+
+
+def to_move(move):
+    start, end, flag = move & 63, move >> 6 & 63, move >> 12 & 15
+    board = [["--"] * 8 for _ in range(8)]
+    board[start >> 3][start & 7] = PIECE_NAMES[move >> 16 & 15]
+    if flag & CAPTURE and flag != EN_PASSANT:
+        board[end >> 3][end & 7] = PIECE_NAMES[move >> 20 & 15]
+    return Move((start >> 3, start & 7), (end >> 3, end & 7), board, is_en_passant_move=flag == EN_PASSANT,
+                is_castle_move=flag == KING_CASTLE or flag == QUEEN_CASTLE)
+
+
+"""
+Coordinate notation of a packed move (e2e4, e7e8q), for logs and benchmarks
+"""
+
+
+def to_uci(move):
+    start, end = move & 63, move >> 6 & 63
+    text = FILES[start & 7] + str(8 - (start >> 3)) + FILES[end & 7] + str(8 - (end >> 3))
+    if move >> 12 & PROMOTION:
+        text += "nbrq"[move >> 12 & 3]
+    return text
+
+
+"""
+Finds the move going from start_sq to end_sq ((row, col) tuples) in moves, the GUI always promotes to a queen
+"""
+
+
+def find_move(moves, start_sq, end_sq):
+    start = start_sq[0] * 8 + start_sq[1]
+    end = end_sq[0] * 8 + end_sq[1]
+    found = None
+    for move in moves:
+        if move & 63 == start and move >> 6 & 63 == end:
+            if found is None or move >> 12 & 3 == QUEEN - KNIGHT:
+                found = move
+    return found
+
+
+"""
+Precomputed attack tables
+"""
+
+
+def _leaper_attacks(offsets):
+    table = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        attacks = 0
+        for d_row, d_col in offsets:
+            end_row, end_col = row + d_row, col + d_col
+            if 0 <= end_row < 8 and 0 <= end_col < 8:
+                attacks |= 1 << (end_row * 8 + end_col)
+        table.append(attacks)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_attacks(((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _leaper_attacks(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+# PAWN_ATTACKS[color][square] are the squares a pawn of that color standing on square attacks
+PAWN_ATTACKS = (_leaper_attacks(((-1, -1), (-1, 1))), _leaper_attacks(((1, -1), (1, 1))))
+
+# rook directions first, then bishop directions, (row step, col step)
+# the rays are only used to build the tables below, slider attacks come from magicBitboards
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, 1), (1, -1))
+
+
+def _rays():
+    rays = []
+    for d_row, d_col in DIRECTIONS:
+        direction_rays = []
+        for square in range(64):
+            row, col = divmod(square, 8)
+            ray = 0
+            for i in range(1, 8):
+                end_row, end_col = row + d_row * i, col + d_col * i
+                if not (0 <= end_row < 8 and 0 <= end_col < 8):
+                    break
+                ray |= 1 << (end_row * 8 + end_col)
+            direction_rays.append(ray)
+        rays.append(direction_rays)
+    return rays
+
+
+RAYS = _rays()
+ROOK_RAYS = [RAYS[0][sq] | RAYS[1][sq] | RAYS[2][sq] | RAYS[3][sq] for sq in range(64)]
+BISHOP_RAYS = [RAYS[4][sq] | RAYS[5][sq] | RAYS[6][sq] | RAYS[7][sq] for sq in range(64)]
+
+
+def _between_and_line():
+    # BETWEEN[a][b] squares strictly between a and b, LINE[a][b] the whole line through a and b
+    between = [[0] * 64 for _ in range(64)]
+    line = [[0] * 64 for _ in range(64)]
+    for d in range(8):
+        opposite = d ^ 2  # directions are stored so that d and d ^ 2 point opposite ways
+        for start in range(64):
+            ray = RAYS[d][start]
+            while ray:
+                end = (ray & -ray).bit_length() - 1
+                ray &= ray - 1
+                between[start][end] = RAYS[d][start] & RAYS[opposite][end]
+                line[start][end] = RAYS[d][start] | RAYS[opposite][start] | (1 << start)
+    return between, line
+
+
+BETWEEN, LINE = _between_and_line()
+
+# castle rights that survive a move touching the square (king or rook leaving it, or rook captured on it)
+CASTLE_MASK = [WKS | WQS | BKS | BQS] * 64
+CASTLE_MASK[0] &= ~BQS
+CASTLE_MASK[4] &= ~(BKS | BQS)
+CASTLE_MASK[7] &= ~BKS
+CASTLE_MASK[56] &= ~WQS
+CASTLE_MASK[60] &= ~(WKS | WQS)
+CASTLE_MASK[63] &= ~WKS
+
+"""
+Zobrist keys, one random 64 bit number per (piece, square), for the side to move,
+for every castle rights mask and for the file of the en passant square.
+The seed is fixed so a position gets the same key in every process.
+"""
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST_PIECES = [[_zobrist_random.getrandbits(64) for _ in range(64)] for _ in range(12)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLE = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+# the pawn keys again with zeros for every other piece, GameState.pawnHash is the pawn part of the Zobrist key
+ZOBRIST_PAWNS = [ZOBRIST_PIECES[piece] if piece % 6 == PAWN else [0] * 64 for piece in range(12)]
+
+"""
+Material plus piece-square score of every piece on every square, in hundredths of a pawn, white positive, built
+from the evaluation's pieceSquareTables. Every board change keeps GameState.pieceSquareScore up to date, so the
+evaluation reads the total instead of scanning the board. set_piece_square_table swaps in other values.
+"""
+PIECE_SQUARE_TABLE = pieceSquareTables.build_piece_square_table(PIECE_NAMES)
+
+
+def set_piece_square_table(table):
+    # filled in place so the lists add_piece and friends already hold stay the ones in use
+    for piece in range(12):
+        PIECE_SQUARE_TABLE[piece][:] = table[piece]
+
+
+def lsb(bitboard):
+    return (bitboard & -bitboard).bit_length() - 1
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:  # python before 3.10
+    def popcount(bitboard):
+        return bin(bitboard).count("1")
+
+
+class GameState:
+    def __init__(self, fen=START_FEN):
+        self.pieces = [0] * 12  # one bitboard per piece, indexed like PIECE_NAMES
+        self.occupancy = [0, 0]  # all white pieces, all black pieces
+        self.squares = [EMPTY] * 64  # piece index on each square for quick lookups
+        # 8x8 mirror of the position in the copyEngine format, the GUI and the evaluation read it
+        self.board = [["--"] * 8 for _ in range(8)]
+        self.hash = 0  # Zobrist key of the position, updated by every board change
+        self.pieceSquareScore = 0  # sum of PIECE_SQUARE_TABLE over the pieces, updated by every board change
+        self.pawnHash = 0  # Zobrist key of the pawns alone, for caching pawn structure scores
+        self.whiteToMove = True
+        self.moveLog = []
+        # two words per ply: the Zobrist key before the move and a packed record of castle rights (bits 0-3),
+        # en passant file (bits 4-7, 8 for none), captured piece (bits 8-11) and halfmove clock (bits 12 and up).
+        # A position loaded from a snapshot starts with key only entries for its history and an empty moveLog
+        self.undoStack = array("Q", bytes(16 * UNDO_STACK_PLIES))
+        self.ply = 0
+        self.plyOffset = 0  # plies played before self.ply was 0, for the fullmove number
+        self.castleRights = 0
+        self.enPassantSquare = -1
+        self.halfmoveClock = 0  # plies since the last capture or pawn move
+        self.load_fen(fen)
+        self.inCheck = False
+        self.killer_moves = set()
+        self.checkMate = False
+        self.staleMate = False
+        self.isPieceCapture = False
+
+    @property
+    def whiteKingLocation(self):
+        return divmod(lsb(self.pieces[5]), 8)
+
+    @property
+    def blackKingLocation(self):
+        return divmod(lsb(self.pieces[11]), 8)
+
+    @property
+    def enPassantPossible(self):
+        return divmod(self.enPassantSquare, 8) if self.enPassantSquare >= 0 else ()
+
+    @property
+    def fullmoveNumber(self):
+        return (self.plyOffset + self.ply) // 2 + 1
+
+    @property
+    def currentCastleRights(self):
+        rights = self.castleRights
+        return CastleRights(bool(rights & WKS), bool(rights & BKS), bool(rights & WQS), bool(rights & BQS))
+
+    """
+    Sets up the position described by a FEN string, the move log starts empty
+    """
+
+    def load_fen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        self.clear_board()
+        rows = fields[0].split("/")
+        if len(rows) != 8:
+            raise ValueError("FEN board needs 8 rows: " + fen)
+        for row, text in enumerate(rows):
+            col = 0
+            for char in text:
+                if char.isdigit():
+                    col += int(char)
+                elif char in FEN_PIECES and col < 8:
+                    self.add_piece(FEN_PIECES.index(char), row * 8 + col)
+                    col += 1
+                else:
+                    raise ValueError("bad FEN row %r: %s" % (text, fen))
+            if col != 8:
+                raise ValueError("bad FEN row %r: %s" % (text, fen))
+        if popcount(self.pieces[WHITE * 6 + KING]) != 1 or popcount(self.pieces[BLACK * 6 + KING]) != 1:
+            raise ValueError("FEN needs exactly one king per side: " + fen)
+        if (self.pieces[WHITE * 6 + PAWN] | self.pieces[BLACK * 6 + PAWN]) & (0xFF | 0xFF << 56):
+            raise ValueError("FEN has a pawn on the first or last rank: " + fen)
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: " + fen)
+        self.whiteToMove = fields[1] == "w"
+        them = BLACK if self.whiteToMove else WHITE
+        if self.is_attacked(lsb(self.pieces[them * 6 + KING]), them ^ 1, self.occupancy[0] | self.occupancy[1]):
+            raise ValueError("the side that just moved is in check: " + fen)
+        self.castleRights = 0
+        squares = self.squares
+        # a right is only kept while its king and rook are still on their home squares
+        for char, right, king, rook, piece in (("K", WKS, 60, 63, 0), ("Q", WQS, 60, 56, 0),
+                                               ("k", BKS, 4, 7, 6), ("q", BQS, 4, 0, 6)):
+            if char in fields[2] and squares[king] == piece + KING and squares[rook] == piece + ROOK:
+                self.castleRights |= right
+        if fields[3] == "-":
+            self.enPassantSquare = -1
+        else:
+            # the square behind a pawn the side that just moved pushed two squares
+            rank = "6" if self.whiteToMove else "3"
+            if len(fields[3]) != 2 or fields[3][0] not in FILES or fields[3][1] != rank:
+                raise ValueError("FEN en passant square must be - or on rank %s: %s" % (rank, fen))
+            square = (8 - int(rank)) * 8 + FILES.index(fields[3][0])
+            pushed = square + 8 if self.whiteToMove else square - 8
+            if squares[square] != EMPTY or squares[pushed] != (BLACK if self.whiteToMove else WHITE) * 6 + PAWN:
+                raise ValueError("FEN en passant square without a pawn that just moved past it: " + fen)
+            self.enPassantSquare = square
+        self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        fullmove = int(fields[5]) if len(fields) > 5 else 1
+        self.moveLog = []
+        self.ply = 0
+        self.plyOffset = (fullmove - 1) * 2 + (not self.whiteToMove)
+        self.hash = self.compute_hash()
+
+    def clear_board(self):
+        self.pieces = [0] * 12
+        self.occupancy = [0, 0]
+        self.squares = [EMPTY] * 64
+        self.board = [["--"] * 8 for _ in range(8)]
+        self.hash = 0
+        self.pieceSquareScore = 0
+        self.pawnHash = 0
+
+    """
+    Returns the FEN string of the current position
+    """
+
+    def to_fen(self):
+        rows = []
+        for row in range(8):
+            text = ""
+            empty = 0
+            for piece in self.squares[row * 8:row * 8 + 8]:
+                if piece == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += FEN_PIECES[piece]
+            rows.append(text + str(empty) if empty else text)
+        castle = "".join(char for char, right in (("K", WKS), ("Q", WQS), ("k", BKS), ("q", BQS))
+                         if self.castleRights & right) or "-"
+        if self.enPassantSquare >= 0:
+            en_passant = FILES[self.enPassantSquare & 7] + str(8 - (self.enPassantSquare >> 3))
+        else:
+            en_passant = "-"
+        return "%s %s %s %s %d %d" % ("/".join(rows), "w" if self.whiteToMove else "b", castle, en_passant,
+                                      self.halfmoveClock, self.fullmoveNumber)
+
+    """
+    Packs the position and its recent Zobrist key history into a compact byte string (see SNAPSHOT_HEADER),
+    load_snapshot or from_snapshot rebuild it on the other side
+    """
+
+    def snapshot(self):
+        squares = self.squares
+        packed = bytes(squares[i] | squares[i + 1] << 4 for i in range(0, 64, 2))
+        history = min(self.halfmoveClock, self.ply)
+        keys = self.undoStack[(self.ply - history) << 1:self.ply << 1:2]
+        return SNAPSHOT_HEADER.pack(packed, (not self.whiteToMove) | self.castleRights << 1,
+                                    self.enPassantSquare if self.enPassantSquare >= 0 else 255,
+                                    self.halfmoveClock, self.fullmoveNumber, history) + keys.tobytes()
+
+    def load_snapshot(self, data):
+        packed, flags, en_passant, halfmove, fullmove, history = SNAPSHOT_HEADER.unpack_from(data)
+        self.clear_board()
+        for i, byte in enumerate(packed):
+            if byte & 15 != EMPTY:
+                self.add_piece(byte & 15, i * 2)
+            if byte >> 4 != EMPTY:
+                self.add_piece(byte >> 4, i * 2 + 1)
+        self.whiteToMove = not flags & 1
+        self.castleRights = flags >> 1
+        self.enPassantSquare = en_passant if en_passant != 255 else -1
+        self.halfmoveClock = halfmove
+        keys = array("Q", data[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + history * 8])
+        if len(self.undoStack) < 2 * len(keys) + 2:
+            self.undoStack.extend(array("Q", bytes(16 * len(keys))))
+        self.undoStack[0:2 * len(keys):2] = keys
+        self.undoStack[1:2 * len(keys):2] = array("Q", bytes(8 * len(keys)))
+        self.moveLog = []
+        self.ply = len(keys)
+        self.plyOffset = (fullmove - 1) * 2 + (not self.whiteToMove) - self.ply
+        self.hash = self.compute_hash()
+        self.checkMate = self.staleMate = self.isPieceCapture = False
+
+    def add_piece(self, piece, square):
+        bit = 1 << square
+        self.pieces[piece] |= bit
+        self.occupancy[piece // 6] |= bit
+        self.squares[square] = piece
+        self.board[square >> 3][square & 7] = PIECE_NAMES[piece]
+        self.hash ^= ZOBRIST_PIECES[piece][square]
+        self.pawnHash ^= ZOBRIST_PAWNS[piece][square]
+        self.pieceSquareScore += PIECE_SQUARE_TABLE[piece][square]
+
+    def remove_piece(self, square):
+        piece = self.squares[square]
+        bit = 1 << square
+        self.pieces[piece] ^= bit
+        self.occupancy[piece // 6] ^= bit
+        self.squares[square] = EMPTY
+        self.board[square >> 3][square & 7] = "--"
+        self.hash ^= ZOBRIST_PIECES[piece][square]
+        self.pawnHash ^= ZOBRIST_PAWNS[piece][square]
+        self.pieceSquareScore -= PIECE_SQUARE_TABLE[piece][square]
+        return piece
+
+    def move_piece(self, start, end):
+        piece = self.squares[start]
+        bits = (1 << start) | (1 << end)
+        self.pieces[piece] ^= bits
+        self.occupancy[piece // 6] ^= bits
+        self.squares[start] = EMPTY
+        self.squares[end] = piece
+        self.board[start >> 3][start & 7] = "--"
+        self.board[end >> 3][end & 7] = PIECE_NAMES[piece]
+        self.hash ^= ZOBRIST_PIECES[piece][start] ^ ZOBRIST_PIECES[piece][end]
+        self.pawnHash ^= ZOBRIST_PAWNS[piece][start] ^ ZOBRIST_PAWNS[piece][end]
+        table = PIECE_SQUARE_TABLE[piece]
+        self.pieceSquareScore += table[end] - table[start]
+
+    def compute_pawn_hash(self):
+        key = 0
+        for piece in (PAWN, 6 + PAWN):
+            pawns = self.pieces[piece]
+            while pawns:
+                key ^= ZOBRIST_PIECES[piece][lsb(pawns)]
+                pawns &= pawns - 1
+        return key
+
+    def compute_piece_square_score(self):
+        return sum(PIECE_SQUARE_TABLE[piece][square] for square, piece in enumerate(self.squares) if piece != EMPTY)
+
+    """
+    Computes the Zobrist key from scratch, make_move and undo_move keep self.hash equal to it
+    """
+
+    def compute_hash(self):
+        key = ZOBRIST_CASTLE[self.castleRights]
+        for square in range(64):
+            if self.squares[square] != EMPTY:
+                key ^= ZOBRIST_PIECES[self.squares[square]][square]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        if self.enPassantSquare >= 0:
+            key ^= ZOBRIST_EN_PASSANT[self.enPassantSquare & 7]
+        return key
+
+    """
+    Takes a packed move as a parameter and executes it, including castling, pawn promotion and en-passant
+    """
+
+    def make_move(self, move):
+        start = move & 63
+        end = move >> 6 & 63
+        flag = move >> 12 & 15
+        piece = move >> 16 & 15
+        index = self.ply << 1
+        if index == len(self.undoStack):
+            self.undoStack.extend(self.undoStack)
+        self.undoStack[index] = self.hash
+        ep_file = self.enPassantSquare & 7 if self.enPassantSquare >= 0 else 8
+        self.undoStack[index + 1] = self.castleRights | ep_file << 4 | (move >> 12 & 0xF00) | \
+            self.halfmoveClock << 12  # move >> 12 & 0xF00 is the captured piece
+        self.ply += 1
+        if flag & CAPTURE or piece == PAWN or piece == PAWN + 6:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if flag == EN_PASSANT:
+            self.remove_piece(end + 8 if piece == PAWN else end - 8)  # capturing the pawn
+        elif flag & CAPTURE:
+            self.remove_piece(end)
+        self.move_piece(start, end)
+        if flag & PROMOTION:
+            self.remove_piece(end)
+            self.add_piece(piece + KNIGHT + (flag & 3), end)
+        elif flag == KING_CASTLE:
+            self.move_piece(end + 1, end - 1)
+        elif flag == QUEEN_CASTLE:
+            self.move_piece(end - 2, end + 1)
+        if self.enPassantSquare >= 0:
+            self.hash ^= ZOBRIST_EN_PASSANT[self.enPassantSquare & 7]
+        if flag == DOUBLE_PUSH:
+            self.enPassantSquare = (start + end) // 2
+            self.hash ^= ZOBRIST_EN_PASSANT[end & 7]
+        else:
+            self.enPassantSquare = -1
+        castle_rights = self.castleRights & CASTLE_MASK[start] & CASTLE_MASK[end]
+        if castle_rights != self.castleRights:
+            self.hash ^= ZOBRIST_CASTLE[self.castleRights] ^ ZOBRIST_CASTLE[castle_rights]
+            self.castleRights = castle_rights
+        self.hash ^= ZOBRIST_BLACK_TO_MOVE
+        self.whiteToMove = not self.whiteToMove
+        self.moveLog.append(move)
+        if flag & CAPTURE:
+            self.isPieceCapture = True
+
+    """
+    Passes the turn, for null move pruning in the search. It goes on the move log as NULL_MOVE and is taken
+    back with undo_move like any other move. The side to move must not be in check.
+    """
+
+    def make_null_move(self):
+        index = self.ply << 1
+        if index == len(self.undoStack):
+            self.undoStack.extend(self.undoStack)
+        self.undoStack[index] = self.hash
+        ep_file = self.enPassantSquare & 7 if self.enPassantSquare >= 0 else 8
+        self.undoStack[index + 1] = self.castleRights | ep_file << 4 | EMPTY << 8 | self.halfmoveClock << 12
+        self.ply += 1
+        self.halfmoveClock = 0  # nothing before a pass counts as a repetition
+        if self.enPassantSquare >= 0:
+            self.hash ^= ZOBRIST_EN_PASSANT[self.enPassantSquare & 7]
+            self.enPassantSquare = -1
+        self.hash ^= ZOBRIST_BLACK_TO_MOVE
+        self.whiteToMove = not self.whiteToMove
+        self.moveLog.append(NULL_MOVE)
+
+    def undo_move(self):
+        if len(self.moveLog) != 0:  # make sure there is a move to undo
+            move = self.moveLog.pop()
+            self.ply -= 1
+            index = self.ply << 1
+            record = self.undoStack[index + 1]
+            self.castleRights = record & 15
+            self.whiteToMove = not self.whiteToMove
+            if record & 0x80:
+                self.enPassantSquare = -1
+            else:
+                self.enPassantSquare = (16 if self.whiteToMove else 40) + (record >> 4 & 7)
+            if move == NULL_MOVE:
+                self.halfmoveClock = record >> 12
+                self.hash = self.undoStack[index]
+                return
+            start = move & 63
+            end = move >> 6 & 63
+            flag = move >> 12 & 15
+            captured = record >> 8 & 15
+            self.halfmoveClock = record >> 12
+            if flag & PROMOTION:
+                self.remove_piece(end)
+                self.add_piece(move >> 16 & 15, end)
+            elif flag == KING_CASTLE:
+                self.move_piece(end - 1, end + 1)
+            elif flag == QUEEN_CASTLE:
+                self.move_piece(end + 1, end - 2)
+            self.move_piece(end, start)
+            if flag == EN_PASSANT:
+                self.add_piece(captured, end + 8 if move >> 16 & 15 == PAWN else end - 8)
+            elif captured != EMPTY:
+                self.add_piece(captured, end)
+            self.hash = self.undoStack[index]
+            self.checkMate = False
+            self.staleMate = False
+            self.isPieceCapture = False
+
+    """
+    Returns a bitboard of the pieces of color by_color attacking square
+    """
+
+    def attackers_to(self, square, by_color, occupied):
+        pieces = self.pieces
+        base = by_color * 6
+        attackers = KNIGHT_ATTACKS[square] & pieces[base + KNIGHT]
+        attackers |= PAWN_ATTACKS[by_color ^ 1][square] & pieces[base + PAWN]
+        attackers |= KING_ATTACKS[square] & pieces[base + KING]
+        rooks = pieces[base + ROOK] | pieces[base + QUEEN]
+        if rooks & ROOK_RAYS[square]:
+            attackers |= rook_attacks(square, occupied) & rooks
+        bishops = pieces[base + BISHOP] | pieces[base + QUEEN]
+        if bishops & BISHOP_RAYS[square]:
+            attackers |= bishop_attacks(square, occupied) & bishops
+        return attackers
+
+    def is_attacked(self, square, by_color, occupied):
+        pieces = self.pieces
+        base = by_color * 6
+        if KNIGHT_ATTACKS[square] & pieces[base + KNIGHT] or \
+                PAWN_ATTACKS[by_color ^ 1][square] & pieces[base + PAWN] or \
+                KING_ATTACKS[square] & pieces[base + KING]:
+            return True
+        rooks = pieces[base + ROOK] | pieces[base + QUEEN]
+        if rooks & ROOK_RAYS[square] and rook_attacks(square, occupied) & rooks:
+            return True
+        bishops = pieces[base + BISHOP] | pieces[base + QUEEN]
+        return bool(bishops & BISHOP_RAYS[square] and bishop_attacks(square, occupied) & bishops)
+
+    """
+    Static exchange evaluation of a capture or promotion: the material the side to move wins (in SEE_VALUES
+    units) when both sides keep recapturing on the end square with their least valuable piece and either side
+    may stop. Sliders behind the capturing pieces join in as the line opens, pins are ignored.
+    """
+
+    def see(self, move):
+        start = move & 63
+        end = move >> 6 & 63
+        flag = move >> 12 & 15
+        piece = move >> 16 & 15
+        captured = move >> 20 & 15
+        pieces = self.pieces
+        occupied = self.occupancy[0] | self.occupancy[1]
+        gain = [SEE_VALUES[captured % 6] if captured != EMPTY else 0]
+        on_square = SEE_VALUES[piece % 6]  # value of the piece that will be taken next
+        if flag == EN_PASSANT:
+            occupied ^= 1 << (end + 8 if piece == PAWN else end - 8)
+        elif flag & PROMOTION:
+            promoted = SEE_VALUES[KNIGHT + (flag & 3)]
+            gain[0] += promoted - SEE_VALUES[PAWN]
+            on_square = promoted
+        occupied ^= 1 << start
+        bishops = pieces[BISHOP] | pieces[QUEEN] | pieces[6 + BISHOP] | pieces[6 + QUEEN]
+        rooks = pieces[ROOK] | pieces[QUEEN] | pieces[6 + ROOK] | pieces[6 + QUEEN]
+        attackers = (self.attackers_to(end, WHITE, occupied) | self.attackers_to(end, BLACK, occupied)) & occupied
+        side = (piece // 6) ^ 1
+        while True:
+            own = attackers & self.occupancy[side]
+            if not own:
+                break
+            for piece_type in range(6):
+                from_set = own & pieces[side * 6 + piece_type]
+                if from_set:
+                    break
+            if piece_type == KING and attackers & self.occupancy[side ^ 1]:
+                break  # the king can't take a defended piece
+            gain.append(on_square - gain[-1])
+            on_square = SEE_VALUES[piece_type]
+            occupied ^= from_set & -from_set
+            attackers |= (bishop_attacks(end, occupied) & bishops) | (rook_attacks(end, occupied) & rooks)
+            attackers &= occupied
+            side ^= 1
+        for depth in range(len(gain) - 1, 0, -1):
+            gain[depth - 1] = -max(-gain[depth - 1], gain[depth])
+        return gain[0]
+
+    def square_under_attack(self, row, col):
+        enemy = BLACK if self.whiteToMove else WHITE
+        return self.is_attacked(row * 8 + col, enemy, self.occupancy[0] | self.occupancy[1])
+
+    ''' ALL MOVES CONSIDERING CHECKS'''
+
+    def get_valid_moves(self):
+        moves = []
+        self.generate_legal_moves(moves)
+        self.checkMate = self.inCheck and len(moves) == 0
+        self.staleMate = not self.inCheck and len(moves) == 0
+        return moves
+
+    """
+    True when the side to move is in check, one lookup outward from the king instead of a move generation
+    """
+
+    def in_check(self):
+        us = WHITE if self.whiteToMove else BLACK
+        return self.is_attacked(lsb(self.pieces[us * 6 + KING]), us ^ 1, self.occupancy[0] | self.occupancy[1])
+
+    """
+    True when move, a legal move of the side to move, checks the enemy king: directly from its end square or by
+    uncovering a slider. Castling and promotions are rare enough to be made and taken back instead.
+    """
+
+    def gives_check(self, move):
+        start = move & 63
+        end = move >> 6 & 63
+        flag = move >> 12 & 15
+        if flag & PROMOTION or flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            self.make_move(move)
+            check = self.in_check()
+            self.undo_move()
+            return check
+        piece = move >> 16 & 15
+        us = piece // 6
+        base = us * 6
+        pieces = self.pieces
+        king_square = lsb(pieces[(us ^ 1) * 6 + KING])
+        from_bit = 1 << start
+        to_bit = 1 << end
+        occupied = (self.occupancy[0] | self.occupancy[1]) & ~from_bit | to_bit
+        if flag == EN_PASSANT:
+            occupied &= ~(1 << (end + 8 if us == WHITE else end - 8))
+        kind = piece - base
+        if kind == PAWN:
+            if PAWN_ATTACKS[us ^ 1][king_square] & to_bit:
+                return True
+        elif kind == KNIGHT:
+            if KNIGHT_ATTACKS[king_square] & to_bit:
+                return True
+        rooks = (pieces[base + ROOK] | pieces[base + QUEEN]) & ~from_bit
+        bishops = (pieces[base + BISHOP] | pieces[base + QUEEN]) & ~from_bit
+        if kind == ROOK or kind == QUEEN:
+            rooks |= to_bit
+        if kind == BISHOP or kind == QUEEN:
+            bishops |= to_bit
+        if rooks & ROOK_RAYS[king_square] and rook_attacks(king_square, occupied) & rooks:
+            return True
+        return bool(bishops & BISHOP_RAYS[king_square] and bishop_attacks(king_square, occupied) & bishops)
+
+    """
+    True when the side to move has a piece besides its king and pawns. Without one zugzwang is common, and
+    passing the turn (null move pruning) would overestimate the position.
+    """
+
+    def has_non_pawn_material(self):
+        base = 0 if self.whiteToMove else 6
+        return self.occupancy[0 if self.whiteToMove else 1] != self.pieces[base + PAWN] | self.pieces[base + KING]
+
+    """
+    Returns as soon as one legal move is found, for terminal tests that don't need the move list.
+    Sets inCheck, checkMate and staleMate like get_valid_moves. Castling is never looked at: a legal castle
+    means the king can also step to the square next to it.
+    """
+
+    def has_legal_move(self):
+        pieces = self.pieces
+        us = WHITE if self.whiteToMove else BLACK
+        them = us ^ 1
+        base = us * 6
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+        king_square = lsb(pieces[base + KING])
+        checkers = self.attackers_to(king_square, them, occupied)
+        self.inCheck = checkers != 0
+        self.checkMate = self.staleMate = False
+        if self._find_legal_move(us, king_square, checkers, own, enemy, occupied):
+            return True
+        self.checkMate = self.inCheck
+        self.staleMate = not self.inCheck
+        return False
+
+    def _find_legal_move(self, us, king_square, checkers, own, enemy, occupied):
+        pieces = self.pieces
+        them = us ^ 1
+        base = us * 6
+        without_king = occupied ^ (1 << king_square)
+        targets = KING_ATTACKS[king_square] & ~own
+        while targets:
+            end = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            if not self.is_attacked(end, them, without_king):
+                return True
+        if checkers & (checkers - 1):
+            return False
+        check_mask = checkers | BETWEEN[king_square][lsb(checkers)] if checkers else FULL
+        pinned = self.pinned_pieces(king_square, them * 6, own, occupied)
+        line = LINE[king_square]
+        allowed = ~own & check_mask
+
+        knights = pieces[base + KNIGHT] & ~pinned
+        while knights:
+            start = (knights & -knights).bit_length() - 1
+            knights &= knights - 1
+            if KNIGHT_ATTACKS[start] & allowed:
+                return True
+        queens = pieces[base + QUEEN]
+        for sliders, attacks in ((pieces[base + BISHOP] | queens, bishop_attacks),
+                                 (pieces[base + ROOK] | queens, rook_attacks)):
+            while sliders:
+                start = (sliders & -sliders).bit_length() - 1
+                sliders &= sliders - 1
+                targets = attacks(start, occupied) & allowed
+                if pinned >> start & 1:
+                    targets &= line[start]
+                if targets:
+                    return True
+
+        pawns = pieces[base + PAWN]
+        forward = -8 if us == WHITE else 8
+        start_row = 6 if us == WHITE else 1
+        pawn_attacks = PAWN_ATTACKS[us]
+        while pawns:
+            start = (pawns & -pawns).bit_length() - 1
+            pawns &= pawns - 1
+            pawn_allowed = check_mask & line[start] if pinned >> start & 1 else check_mask
+            end = start + forward
+            targets = pawn_attacks[start] & enemy
+            if not occupied >> end & 1:
+                targets |= 1 << end
+                if start >> 3 == start_row and not occupied >> (end + forward) & 1:
+                    targets |= 1 << (end + forward)
+            if targets & pawn_allowed:
+                return True
+            if self.enPassantSquare >= 0 and pawn_attacks[start] >> self.enPassantSquare & 1:
+                en_passant = []
+                self.generate_en_passant(en_passant, us, start, king_square, occupied)
+                if en_passant:
+                    return True
+        return False
+
+    """ALL MOVES NOT CONSIDERING CHECKS, kept for compatibility with copyEngine"""
+
+    def get_all_possible_moves(self):
+        return self.get_valid_moves()
+
+    """
+    Appends a packed move for every target square of the piece on start
+    """
+
+    def add_moves(self, moves, start, targets):
+        squares = self.squares
+        base = start | squares[start] << 16
+        while targets:
+            end = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            captured = squares[end]
+            if captured == EMPTY:
+                moves.append(base | end << 6 | EMPTY << 20)
+            else:
+                moves.append(base | end << 6 | CAPTURE << 12 | captured << 20)
+
+    """
+    Checks that a move coming from outside the move generator (a hash table or killer slot filled in another
+    position) is legal here. The piece, captured piece and flag must match the board, the piece must be able to
+    reach the end square, and the own king must not be attacked afterwards.
+    """
+
+    def is_legal(self, move):
+        start = move & 63
+        end = move >> 6 & 63
+        flag = move >> 12 & 15
+        piece = move >> 16 & 15
+        captured = move >> 20 & 15
+        us = WHITE if self.whiteToMove else BLACK
+        if piece // 6 != us or self.squares[start] != piece:
+            return False
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE or flag == EN_PASSANT:  # rare, just generate them
+            moves = []
+            self.generate_legal_moves(moves, GEN_CAPTURES if flag == EN_PASSANT else GEN_QUIETS)
+            return move in moves
+        if self.squares[end] != captured or (flag & CAPTURE != 0) != (captured != EMPTY) or \
+                (captured != EMPTY and captured // 6 == us):
+            return False
+        occupied = self.occupancy[0] | self.occupancy[1]
+        piece_type = piece % 6
+        if piece_type == PAWN:
+            forward = -8 if us == WHITE else 8
+            if (flag & PROMOTION != 0) != (end >> 3 == (0 if us == WHITE else 7)):
+                return False
+            if captured != EMPTY:
+                if not PAWN_ATTACKS[us][start] >> end & 1:
+                    return False
+            elif flag == DOUBLE_PUSH:
+                if end != start + 2 * forward or start >> 3 != (6 if us == WHITE else 1) or \
+                        self.squares[start + forward] != EMPTY:
+                    return False
+            elif end != start + forward:
+                return False
+        elif flag & PROMOTION or flag == DOUBLE_PUSH:
+            return False
+        elif piece_type == KNIGHT:
+            if not KNIGHT_ATTACKS[start] >> end & 1:
+                return False
+        elif piece_type == KING:
+            if not KING_ATTACKS[start] >> end & 1:
+                return False
+        else:
+            attacks = 0
+            if piece_type != ROOK:
+                attacks |= bishop_attacks(start, occupied)
+            if piece_type != BISHOP:
+                attacks |= rook_attacks(start, occupied)
+            if not attacks >> end & 1:
+                return False
+        after = (occupied ^ (1 << start)) | (1 << end)
+        king_square = end if piece_type == KING else lsb(self.pieces[us * 6 + KING])
+        return not self.attackers_to(king_square, us ^ 1, after) & ~(1 << end)
+
+    """
+    Yields the legal moves in the order a search wants to try them: the hash move, captures and promotions
+    (MVV-LVA), the killer moves and then the remaining quiet moves, highest history count first when a history
+    table (indexed by move & 0xFFF) is given. A stage is only generated once the search asks for its first move,
+    so a beta cutoff early on skips the rest of the generation.
+    The caller must undo its moves before asking for the next one.
+    """
+
+    def staged_moves(self, hash_move=0, killers=(), history=None):
+        if hash_move and self.is_legal(hash_move):
+            yield hash_move
+        moves = []
+        self.generate_legal_moves(moves, GEN_CAPTURES)
+        moves.sort(key=capture_order, reverse=True)
+        for move in moves:
+            if move != hash_move:
+                yield move
+        tried = [hash_move]
+        for killer in killers:
+            if killer and killer not in tried and not killer >> 12 & (CAPTURE | PROMOTION) and self.is_legal(killer):
+                tried.append(killer)
+                yield killer
+        del moves[:]
+        self.generate_legal_moves(moves, GEN_QUIETS)
+        if history is not None:
+            moves.sort(key=lambda quiet: history[quiet & 0xFFF], reverse=True)
+        for move in moves:
+            if move not in tried:
+                yield move
+
+    """
+    Bitboard of the pieces of the side owning own that are pinned to their king
+    """
+
+    def pinned_pieces(self, king_square, enemy_base, own, occupied):
+        pieces = self.pieces
+        pinned = 0
+        snipers = (ROOK_RAYS[king_square] & (pieces[enemy_base + ROOK] | pieces[enemy_base + QUEEN])) | \
+            (BISHOP_RAYS[king_square] & (pieces[enemy_base + BISHOP] | pieces[enemy_base + QUEEN]))
+        while snipers:
+            sniper = (snipers & -snipers).bit_length() - 1
+            snipers &= snipers - 1
+            blockers = BETWEEN[king_square][sniper] & occupied
+            if blockers and not blockers & (blockers - 1) and blockers & own:
+                pinned |= blockers
+        return pinned
+
+    """
+    Appends every legal move of the side to move to moves, the caller can reuse the same list.
+    kind selects captures and promotions (GEN_CAPTURES), the remaining quiet moves (GEN_QUIETS) or both.
+    Checks are resolved with a check mask (checking piece plus the squares between it and the king)
+    and pinned pieces are restricted to the line through the king and the pinning piece.
+    """
+
+    def generate_legal_moves(self, moves, kind=GEN_ALL):
+        pieces = self.pieces
+        us = WHITE if self.whiteToMove else BLACK
+        them = us ^ 1
+        base = us * 6
+        enemy_base = them * 6
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+        king_square = lsb(pieces[base + KING])
+        checkers = self.attackers_to(king_square, them, occupied)
+        self.inCheck = checkers != 0
+
+        wanted = (enemy if kind & GEN_CAPTURES else 0) | (~occupied & FULL if kind & GEN_QUIETS else 0)
+
+        # king moves, the king is taken off the board so it can't hide behind itself from a slider
+        without_king = occupied ^ (1 << king_square)
+        targets = KING_ATTACKS[king_square] & wanted
+        while targets:
+            end = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            if not self.is_attacked(end, them, without_king):
+                self.add_moves(moves, king_square, 1 << end)
+        if checkers & (checkers - 1):  # double check, king has to move
+            return
+
+        if checkers:  # block the check or capture the checking piece
+            check_mask = checkers | BETWEEN[king_square][lsb(checkers)]
+        else:
+            check_mask = FULL
+
+        pinned = self.pinned_pieces(king_square, enemy_base, own, occupied)
+        line = LINE[king_square]
+        allowed = wanted & check_mask
+
+        # knights, a pinned knight can never move
+        knights = pieces[base + KNIGHT] & ~pinned
+        while knights:
+            start = (knights & -knights).bit_length() - 1
+            knights &= knights - 1
+            self.add_moves(moves, start, KNIGHT_ATTACKS[start] & allowed)
+
+        # sliding pieces
+        queens = pieces[base + QUEEN]
+        for sliders, attacks in ((pieces[base + BISHOP] | queens, bishop_attacks),
+                                 (pieces[base + ROOK] | queens, rook_attacks)):
+            while sliders:
+                start = (sliders & -sliders).bit_length() - 1
+                sliders &= sliders - 1
+                targets = attacks(start, occupied) & allowed
+                if pinned >> start & 1:
+                    targets &= line[start]
+                self.add_moves(moves, start, targets)
+
+        self.generate_pawn_moves(moves, us, king_square, occupied, enemy, check_mask, pinned, kind)
+
+        if not checkers and kind & GEN_QUIETS:
+            self.generate_castle_moves(moves, us, occupied)
+
+    """
+    Appends the quiet moves of the side to move that check the enemy king directly, for the quiescence search.
+    Discovered checks and castling into check are left out. The side to move must not be in check.
+    """
+
+    def generate_quiet_checks(self, moves):
+        pieces = self.pieces
+        us = WHITE if self.whiteToMove else BLACK
+        them = us ^ 1
+        base = us * 6
+        own = self.occupancy[us]
+        occupied = own | self.occupancy[them]
+        empty = ~occupied & FULL
+        king_square = lsb(pieces[base + KING])
+        enemy_king = lsb(pieces[them * 6 + KING])
+        pinned = self.pinned_pieces(king_square, them * 6, own, occupied)
+        line = LINE[king_square]
+
+        knights = pieces[base + KNIGHT] & ~pinned
+        knight_checks = KNIGHT_ATTACKS[enemy_king] & empty
+        while knights:
+            start = (knights & -knights).bit_length() - 1
+            knights &= knights - 1
+            self.add_moves(moves, start, KNIGHT_ATTACKS[start] & knight_checks)
+
+        bishop_checks = bishop_attacks(enemy_king, occupied) & empty
+        rook_checks = rook_attacks(enemy_king, occupied) & empty
+        for piece, checks in ((BISHOP, bishop_checks), (ROOK, rook_checks), (QUEEN, bishop_checks | rook_checks)):
+            sliders = pieces[base + piece]
+            while sliders:
+                start = (sliders & -sliders).bit_length() - 1
+                sliders &= sliders - 1
+                targets = checks & ((bishop_attacks(start, occupied) if piece != ROOK else 0) |
+                                    (rook_attacks(start, occupied) if piece != BISHOP else 0))
+                if pinned >> start & 1:
+                    targets &= line[start]
+                self.add_moves(moves, start, targets)
+
+        pawn_checks = PAWN_ATTACKS[them][enemy_king] & empty
+        if pawn_checks:
+            piece = base + PAWN
+            forward = -8 if us == WHITE else 8
+            start_row = 6 if us == WHITE else 1
+            promotion_row = 0 if us == WHITE else 7  # promotions are generated with the captures
+            pawns = pieces[piece]
+            while pawns:
+                start = (pawns & -pawns).bit_length() - 1
+                pawns &= pawns - 1
+                allowed = line[start] if pinned >> start & 1 else FULL
+                end = start + forward
+                if occupied >> end & 1 or end >> 3 == promotion_row:
+                    continue
+                if pawn_checks >> end & 1 and allowed >> end & 1:
+                    moves.append(start | end << 6 | piece << 16 | EMPTY << 20)
+                end += forward
+                if start >> 3 == start_row and pawn_checks >> end & 1 and allowed >> end & 1 and \
+                        not occupied >> end & 1:
+                    moves.append(start | end << 6 | DOUBLE_PUSH << 12 | piece << 16 | EMPTY << 20)
+
+    """
+    Returns the number of legal moves without building them, target sets are popcounted instead.
+    It follows generate_legal_moves step by step, perft uses it to count the leaves in bulk
+    """
+
+    def count_legal_moves(self):
+        pieces = self.pieces
+        us = WHITE if self.whiteToMove else BLACK
+        them = us ^ 1
+        base = us * 6
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+        king_square = lsb(pieces[base + KING])
+        checkers = self.attackers_to(king_square, them, occupied)
+        self.inCheck = checkers != 0
+
+        count = 0
+        without_king = occupied ^ (1 << king_square)
+        targets = KING_ATTACKS[king_square] & ~own
+        while targets:
+            end = (targets & -targets).bit_length() - 1
+            targets &= targets - 1
+            if not self.is_attacked(end, them, without_king):
+                count += 1
+        if checkers & (checkers - 1):
+            return count
+        check_mask = checkers | BETWEEN[king_square][lsb(checkers)] if checkers else FULL
+        pinned = self.pinned_pieces(king_square, them * 6, own, occupied)
+        line = LINE[king_square]
+        allowed = ~own & check_mask
+
+        knights = pieces[base + KNIGHT] & ~pinned
+        while knights:
+            start = (knights & -knights).bit_length() - 1
+            knights &= knights - 1
+            count += popcount(KNIGHT_ATTACKS[start] & allowed)
+        queens = pieces[base + QUEEN]
+        for sliders, attacks in ((pieces[base + BISHOP] | queens, bishop_attacks),
+                                 (pieces[base + ROOK] | queens, rook_attacks)):
+            while sliders:
+                start = (sliders & -sliders).bit_length() - 1
+                sliders &= sliders - 1
+                targets = attacks(start, occupied) & allowed
+                if pinned >> start & 1:
+                    targets &= line[start]
+                count += popcount(targets)
+
+        pawns = pieces[base + PAWN]
+        forward = -8 if us == WHITE else 8
+        start_row = 6 if us == WHITE else 1
+        last_row = 1 if us == WHITE else 6  # pawns on this row promote
+        pawn_attacks = PAWN_ATTACKS[us]
+        extra = []  # en passant and castle moves are rare enough to generate
+        while pawns:
+            start = (pawns & -pawns).bit_length() - 1
+            pawns &= pawns - 1
+            pawn_allowed = check_mask & line[start] if pinned >> start & 1 else check_mask
+            end = start + forward
+            targets = pawn_attacks[start] & enemy
+            if not occupied >> end & 1:
+                targets |= 1 << end
+                if start >> 3 == start_row and not occupied >> (end + forward) & 1:
+                    targets |= 1 << (end + forward)
+            targets &= pawn_allowed
+            count += popcount(targets) * 4 if start >> 3 == last_row else popcount(targets)
+            if self.enPassantSquare >= 0 and pawn_attacks[start] >> self.enPassantSquare & 1:
+                self.generate_en_passant(extra, us, start, king_square, occupied)
+        if not checkers:
+            self.generate_castle_moves(extra, us, occupied)
+        return count + len(extra)
+
+    def generate_pawn_moves(self, moves, us, king_square, occupied, enemy, check_mask, pinned, kind=GEN_ALL):
+        squares = self.squares
+        piece = us * 6 + PAWN
+        pawns = self.pieces[piece]
+        forward = -8 if us == WHITE else 8
+        start_row = 6 if us == WHITE else 1
+        promotion_row = 0 if us == WHITE else 7
+        pawn_attacks = PAWN_ATTACKS[us]
+        line = LINE[king_square]
+        captures = kind & GEN_CAPTURES
+        quiets = kind & GEN_QUIETS
+        while pawns:
+            start = (pawns & -pawns).bit_length() - 1
+            pawns &= pawns - 1
+            base = start | piece << 16
+            allowed = check_mask & line[start] if pinned >> start & 1 else check_mask
+            end = start + forward
+            if not occupied >> end & 1:
+                if allowed >> end & 1:
+                    if end >> 3 == promotion_row:
+                        if captures:
+                            for flag in (PROMOTION + 3, PROMOTION, PROMOTION + 1, PROMOTION + 2):
+                                moves.append(base | end << 6 | flag << 12 | EMPTY << 20)
+                    elif quiets:
+                        moves.append(base | end << 6 | EMPTY << 20)
+                if start >> 3 == start_row and quiets:
+                    end += forward
+                    if not occupied >> end & 1 and allowed >> end & 1:
+                        moves.append(base | end << 6 | DOUBLE_PUSH << 12 | EMPTY << 20)
+            if not captures:
+                continue
+            targets = pawn_attacks[start] & enemy & allowed
+            while targets:
+                end = (targets & -targets).bit_length() - 1
+                targets &= targets - 1
+                captured = base | end << 6 | squares[end] << 20
+                if end >> 3 == promotion_row:
+                    for flag in (PROMOTION + CAPTURE + 3, PROMOTION + CAPTURE, PROMOTION + CAPTURE + 1,
+                                 PROMOTION + CAPTURE + 2):
+                        moves.append(captured | flag << 12)
+                else:
+                    moves.append(captured | CAPTURE << 12)
+            if self.enPassantSquare >= 0 and pawn_attacks[start] >> self.enPassantSquare & 1:
+                self.generate_en_passant(moves, us, start, king_square, occupied)
+
+    def generate_en_passant(self, moves, us, start, king_square, occupied):
+        end = self.enPassantSquare
+        captured = end + 8 if us == WHITE else end - 8
+        # two pawns leave their squares at once, so simply look for any attack on the king afterwards
+        after = (occupied ^ (1 << start) ^ (1 << captured)) | (1 << end)
+        if self.attackers_to(king_square, us ^ 1, after) & ~(1 << captured):
+            return
+        moves.append(encode_move(start, end, EN_PASSANT, us * 6 + PAWN, (us ^ 1) * 6 + PAWN))
+
+    """
+    Generate the castle moves of the side to move, the king is known not to be in check
+    """
+
+    def generate_castle_moves(self, moves, us, occupied):
+        them = us ^ 1
+        if us == WHITE:
+            king_side, queen_side, king_square = WKS, WQS, 60
+        else:
+            king_side, queen_side, king_square = BKS, BQS, 4
+        king_side = self.castleRights & king_side and not occupied >> (king_square + 1) & 1 and \
+            not occupied >> (king_square + 2) & 1
+        queen_side = self.castleRights & queen_side and not occupied >> (king_square - 1) & 1 and \
+            not occupied >> (king_square - 2) & 1 and not occupied >> (king_square - 3) & 1
+        if not king_side and not queen_side:
+            return
+        # look outward from the two squares the king crosses
+        king_side = king_side and not self.is_attacked(king_square + 1, them, occupied) and \
+            not self.is_attacked(king_square + 2, them, occupied)
+        queen_side = queen_side and not self.is_attacked(king_square - 1, them, occupied) and \
+            not self.is_attacked(king_square - 2, them, occupied)
+        if king_side:
+            moves.append(encode_move(king_square, king_square + 2, KING_CASTLE, us * 6 + KING))
+        if queen_side:
+            moves.append(encode_move(king_square, king_square - 2, QUEEN_CASTLE, us * 6 + KING))
+
+
+def from_snapshot(data):
+    gs = GameState()
+    gs.load_snapshot(data)
+    return gs
@@ -1,78 +1,72 @@
+import os
 import random
+import time
 
-piece_score = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
+import bitboardEngine
+import engineProfile
+import searchStats
+import transpositionTable
+from transpositionTable import EXACT, LOWER, UPPER
+
+piece_values = (1, 3, 3, 5, 9, 0)  # pieceSquareTables.piece_score by bitboardEngine piece type
 CHECKMATE = 1000
 STALEMATE = 0
-DEPTH = 3
-MAX_KILLER_MOVES = 20
-
-knight_position_score = [[1, 1, 1, 1, 1, 1, 1, 1],
-                         [1, 2, 2, 2, 2, 2, 2, 1],
-                         [1, 2, 3, 3, 3, 3, 2, 1],
-                         [1, 2, 3, 4, 4, 3, 2, 1],
-                         [1, 2, 3, 4, 4, 3, 2, 1],
-                         [1, 2, 3, 3, 3, 3, 2, 1],
-                         [1, 2, 2, 2, 2, 2, 2, 1],
-                         [1, 1, 1, 1, 1, 1, 1, 1]]
-
-bishop_position_score = [[4, 3, 2, 1, 1, 2, 3, 4],
-                         [3, 4, 3, 2, 2, 3, 4, 3],
-                         [2, 3, 4, 3, 3, 4, 3, 2],
-                         [1, 2, 3, 4, 4, 3, 2, 1],
-                         [1, 2, 3, 4, 4, 3, 2, 1],
-                         [2, 3, 4, 3, 3, 4, 3, 2],
-                         [3, 4, 3, 2, 2, 3, 4, 3],
-                         [4, 3, 2, 1, 1, 2, 3, 4]]
-
-rook_position_score = [[4, 3, 4, 4, 4, 4, 3, 4],
-                       [4, 4, 4, 4, 4, 4, 4, 4],
-                       [1, 1, 2, 3, 3, 2, 1, 1],
-                       [1, 2, 3, 4, 4, 3, 2, 1],
-                       [1, 2, 3, 4, 4, 3, 2, 1],
-                       [1, 1, 2, 3, 3, 2, 1, 1],
-                       [4, 4, 4, 4, 4, 4, 4, 4],
-                       [4, 3, 4, 4, 4, 4, 3, 4]]
-
-queen_position_score = [[1, 1, 1, 3, 1, 1, 1, 1],
-                        [1, 2, 3, 3, 3, 1, 1, 1],
-                        [1, 4, 3, 3, 3, 4, 2, 1],
-                        [1, 2, 3, 3, 3, 2, 2, 1],
-                        [1, 2, 3, 3, 3, 2, 2, 1],
-                        [1, 4, 3, 3, 3, 4, 2, 1],
-                        [1, 2, 3, 3, 3, 1, 1, 1],
-                        [1, 1, 1, 3, 1, 1, 1, 1]]
-
-white_pawn_position_score = [[8, 8, 8, 8, 8, 8, 8, 8],
-                             [8, 8, 8, 8, 8, 8, 8, 8],
-                             [5, 6, 6, 7, 7, 6, 6, 5],
-                             [2, 3, 3, 5, 5, 3, 3, 2],
-                             [1, 2, 3, 4, 4, 3, 2, 1],
-                             [1, 1, 2, 3, 3, 2, 1, 1],
-                             [1, 1, 1, 0, 0, 1, 1, 1],
-                             [0, 0, 0, 0, 0, 0, 0, 0]]
-
-black_pawn_position_score = [[0, 0, 0, 0, 0, 0, 0, 0],
-                             [1, 1, 1, 0, 0, 1, 1, 1],
-                             [1, 1, 2, 3, 3, 2, 1, 1],
-                             [1, 2, 3, 4, 4, 3, 2, 1],
-                             [2, 3, 3, 5, 5, 3, 3, 2],
-                             [2, 3, 3, 5, 5, 3, 3, 2],
-                             [5, 6, 6, 7, 7, 6, 6, 5],
-                             [8, 8, 8, 8, 8, 8, 8, 8],
-                             [8, 8, 8, 8, 8, 8, 8, 8]]
-
-king_position_scores = [[1, 1.5, 2, 2.5, 2.5, 2, 1.5, 1],
-                        [1.5, 2, 2.5, 3, 3, 2.5, 2, 1.5],
-                        [2, 2.5, 3, 3.5, 3.5, 3, 2.5, 2],
-                        [2.5, 3, 3.5, 4, 4, 3.5, 3, 2.5],
-                        [2.5, 3, 3.5, 4, 4, 3.5, 3, 2.5],
-                        [2, 2.5, 3, 3.5, 3.5, 3, 2.5, 2],
-                        [1.5, 2, 2.5, 3, 3, 2.5, 2, 1.5],
-                        [1, 1.5, 2, 2.5, 2.5, 2, 1.5, 1]]
-
-piece_position_scores = {"N": knight_position_score, "B": bishop_position_score, "Q": queen_position_score,
-                         "R": rook_position_score, "wp": white_pawn_position_score, "bp": black_pawn_position_score,
-                         "K": king_position_scores}
+MAX_PLY = 64
+QUIESCENCE_PLIES = 6  # captures searched below the horizon before the static score is taken as is
+DELTA_MARGIN = 2  # pawns, a capture that can't lift the score to alpha even with this much extra is skipped
+ASPIRATION_WINDOW = 0.5  # half width of the first window around the previous iteration's score, in pawns
+
+# search limits per difficulty: seconds per move, node cap (0 for none), deepest iteration, number of Lazy SMP
+# search processes (see lazySMP) and whether to search the expected reply while the human thinks
+LEVELS = {
+    "Easy": {"move_time": 0.5, "nodes": 3000, "depth": 2, "workers": 1, "ponder": False},
+    "Intermediate": {"move_time": 1.5, "nodes": 50000, "depth": 5, "workers": 1, "ponder": False},
+    "Hard": {"move_time": 5.0, "nodes": 0, "depth": MAX_PLY - 1, "workers": os.cpu_count() or 1, "ponder": True},
+}
+limits = dict(LEVELS["Intermediate"])
+search_start = 0.0  # perf_counter time the budget of the running search counts from
+budget = 0.0
+deadline = 0.0  # perf_counter time at which a running search has to stop
+node_limit = 0
+CHECK_NODES = 256  # nodes searched between two looks at the clock and the stop event
+next_check = 0  # move_count at which check_limits runs next
+stop_event = None  # multiprocessing.Event that ends a running search when set, see lazySMP
+ponder_event = None  # multiprocessing.Event set when the move a ponder search guessed is played, see engineWorker
+pondering = False  # the running search is a ponder search still waiting for its guess to be played
+ponder_limits = None
+progress_queue = None  # queue that gets ("info", progress_tag, depth, score, nodes, seconds, pv) per iteration
+progress_tag = None
+killer_moves = [[0, 0] for _ in range(MAX_PLY)]  # the last two quiet moves that caused a beta cutoff, per ply
+history = [[0] * 4096, [0] * 4096]  # per side, indexed by the from-to bits of a move (move & 0xFFF)
+HISTORY_LIMIT = 1 << 20  # the history tables are halved when an entry gets past this and before every search
+# move ordering switches, for comparing node counts (see bench.py)
+USE_HASH_MOVE = True
+USE_KILLERS = True
+USE_HISTORY = True
+# selective search switches, for A/B comparisons (see bench.py)
+USE_CHECK_EXTENSIONS = True
+USE_NULL_MOVE = True
+USE_LMR = True
+USE_FUTILITY = True
+USE_RAZORING = True
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2  # R, one more from depth 7 on
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVES = 3  # moves searched at full depth before late ones are reduced
+LMR_DEEP_MOVES = 8  # moves after this many are reduced by one ply more
+FUTILITY_MARGINS = (0, 1.0, 3.0)  # by remaining depth, in pawns
+RAZOR_MARGIN = 2.0  # pawns below alpha at depth 1 that hand the node to the quiescence search
+qnode_count = 0  # quiescence nodes in the last search, move_count counts them too
+cutoff_count = 0  # beta cutoffs in the last search
+first_move_cutoffs = 0  # of which on the first move searched
+last_search_ply = -1  # game ply (see search) of the previous search, -1 for none
+stats = searchStats.SearchStats()  # of the last search
+stats_log = searchStats.log_path()  # file every search appends its stats to as a JSON line, None for none
+part_timing = False  # see set_part_timing
+TT_MEGABYTES = 16
+tt = transpositionTable.TranspositionTable(TT_MEGABYTES)
+TT_SCALE = 100  # scores are stored in the table as ints, in hundredths of a pawn
+
 
 """
 Picks and returns a random move
@@ -83,64 +77,520 @@ def find_random_move(valid_moves):
     return valid_moves[random.randint(0, len(valid_moves) - 1)]
 
 
+class SearchTimeout(Exception):
+    pass
+
+
+"""
+Selects the search limits of a difficulty level from LEVELS
+"""
+
+
+def set_difficulty(level):
+    global limits
+    limits = dict(LEVELS[level])
+
+
+"""
+Seconds to spend on this move. With a game clock (time_left, increment and optionally moves_to_go in the
+limits) it is an even share of the remaining time plus most of the increment, never more than half the clock.
+Otherwise it is the fixed move_time.
+"""
+
+
+def allocate_time(search_limits):
+    time_left = search_limits.get("time_left")
+    if time_left:
+        budget = time_left / search_limits.get("moves_to_go", 30) + search_limits.get("increment", 0) * 0.8
+        return min(budget, time_left * 0.5)
+    return search_limits.get("move_time", 0)
+
+
 """
 helper method to make first recursive call
 """
 
 
-def find_best_move(gs, valid_moves, return_queue):
-    global next_move, move_count
-    next_move = None
+def find_best_move(gs, valid_moves, return_queue, search_limits=None):
+    best_move, score, depth = search(gs, valid_moves, search_limits or limits)
+    print(searchStats.summary(stats.as_dict()))
+    return_queue.put(best_move)
+
+
+"""
+Resets the per search state and runs iterative deepening, returns (move, score, depth).
+What the previous search learned carries over when the same process keeps searching one game (engineWorker):
+the transposition table is aged, history counts are halved and the killers move down by the plies played since,
+so the killers of what was ply 2 are the killers of ply 0 now.
+The statistics of the search are left in stats, and appended to stats_log when there is one.
+"""
+
+
+def search(gs, valid_moves, search_limits, start_depth=1):
+    global move_count, qnode_count, killer_moves, cutoff_count, first_move_cutoffs, last_search_ply, stats
     random.shuffle(valid_moves)
+    valid_moves.sort(key=bitboardEngine.capture_order, reverse=True)  # captures first, quiet moves stay shuffled
+    stats = searchStats.SearchStats()
     move_count = 0
-    tt = {}
-    find_move_pvs(gs, valid_moves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    print(move_count)
-    return_queue.put(next_move)
+    qnode_count = 0
+    cutoff_count = 0
+    first_move_cutoffs = 0
+    game_ply = gs.plyOffset + gs.ply
+    played = game_ply - last_search_ply
+    if last_search_ply >= 0 and 0 <= played < MAX_PLY:
+        killer_moves = killer_moves[played:] + [[0, 0] for _ in range(played)]
+    else:
+        killer_moves = [[0, 0] for _ in range(MAX_PLY)]
+    last_search_ply = game_ply
+    age_history()
+    tt.new_search()
+    pawn_probes, pawn_hits = pawn_table.probes, pawn_table.hits
+    searchStats.reset_parts()
+    best_move, score, depth = iterative_deepening(gs, valid_moves, search_limits, start_depth)
+    stats.move = bitboardEngine.to_uci(best_move) if best_move else None
+    stats.score, stats.depth = score, depth
+    stats.nodes, stats.qnodes = move_count - qnode_count, qnode_count
+    stats.seconds = time.perf_counter() - search_start
+    stats.cutoffs, stats.first_move_cutoffs = cutoff_count, first_move_cutoffs
+    stats.tt = tt.stats()
+    probes = pawn_table.probes - pawn_probes
+    stats.pawn_table = {"probes": probes, "hits": pawn_table.hits - pawn_hits,
+                        "hit_rate": round((pawn_table.hits - pawn_hits) / probes, 4) if probes else 0.0}
+    if part_timing:
+        stats.parts = {part: {"seconds": round(searchStats.part_seconds[part], 4),
+                              "calls": searchStats.part_calls[part]} for part in searchStats.PARTS}
+    if stats_log:
+        searchStats.write_json_line(stats_log, stats.as_dict())
+    return best_move, score, depth
+
+
+"""
+Forgets everything learned in the previous game
+"""
+
+
+def new_game():
+    global killer_moves, last_search_ply
+    tt.clear()
+    clear_history()
+    pawn_table.clear()
+    killer_moves = [[0, 0] for _ in range(MAX_PLY)]
+    last_search_ply = -1
+
+
+"""
+The move ordering tables the next search starts from, for handing them between processes: Lazy SMP workers
+start from the engine process's and worker 0 hands its back
+"""
+
+
+def search_state():
+    return {"history": history, "killer_moves": killer_moves, "last_search_ply": last_search_ply}
+
+
+def set_search_state(state):
+    global history, killer_moves, last_search_ply
+    history, killer_moves, last_search_ply = state["history"], state["killer_moves"], state["last_search_ply"]
+
+
+def age_history():
+    for table in history:
+        for index, count in enumerate(table):
+            if count:
+                table[index] = count >> 1
+
+
+def clear_history():
+    for table in history:
+        table[:] = [0] * 4096
+
+
+"""
+Remembers a quiet move that caused a beta cutoff: it becomes the first killer of its ply and its history count
+grows by depth squared, so cutoffs close to the root weigh the most
+"""
+
+
+def record_quiet_cutoff(move, ply, depth, side):
+    killers = killer_moves[ply]
+    if killers[0] != move:
+        killers[1] = killers[0]
+        killers[0] = move
+    table = history[side]
+    index = move & 0xFFF
+    table[index] += depth * depth
+    if table[index] > HISTORY_LIMIT:
+        age_history()
+
+
+"""
+Searches depth 1, 2, 3, ... until the time or node budget runs out and returns (move, score, depth) of the
+last completed iteration. A new iteration isn't started once half the budget is gone since it would most
+likely be cut off. From depth 3 on the search starts with an aspiration window around the previous score,
+and a result outside the window is searched again with a window twice as wide.
+Lazy SMP helpers start at a deeper start_depth so they don't all search the same iteration.
+A ponder search (pondering in the limits) has no budget until ponder_event is set and doesn't return before
+that or a stop, so its answer is always for a move that was played.
+"""
+
+
+def iterative_deepening(gs, valid_moves, search_limits, start_depth=1):
+    global next_move
+    start_clock(search_limits)
+    max_depth = min(search_limits.get("depth", MAX_PLY - 1), MAX_PLY - 1)
+    turn_multiplier = 1 if gs.whiteToMove else -1
+    root_ply = gs.ply
+    best_move = valid_moves[0] if valid_moves else None
+    score = 0
+    completed = 0
+    for depth in range(min(start_depth, max_depth), max_depth + 1):
+        if pondering and ponder_event.is_set():
+            start_clock(ponder_limits, search_start)
+        if completed and budget and time.perf_counter() - search_start > budget / 2:
+            break
+        window = ASPIRATION_WINDOW if depth >= 3 and completed else CHECKMATE
+        alpha = max(score - window, -CHECKMATE)
+        beta = min(score + window, CHECKMATE)
+        try:
+            while True:
+                next_move = None
+                result = find_move_pvs(gs, depth, alpha, beta, turn_multiplier, 0, valid_moves)
+                window *= 2
+                if result <= alpha and alpha > -CHECKMATE:
+                    alpha = max(result - window, -CHECKMATE)
+                elif result >= beta and beta < CHECKMATE:
+                    beta = min(result + window, CHECKMATE)
+                else:
+                    break
+        except SearchTimeout:
+            while gs.ply > root_ply:  # unwind the moves the interrupted search left on the board
+                gs.undo_move()
+            break
+        score = result
+        completed = depth
+        if next_move is not None:
+            best_move = next_move
+        stats.iterations.append((depth, time.perf_counter() - search_start, move_count))
+        if progress_queue is not None:
+            report_progress(gs, depth, score, best_move)
+        if abs(score) >= CHECKMATE:  # the shortest mate is found first
+            break
+    while pondering and not ponder_event.is_set() and not (stop_event is not None and stop_event.is_set()):
+        ponder_event.wait(0.01)
+    return best_move, score, completed
+
+
+"""
+Starts the budget of a search, from now or from started. A ponder search gets none (no deadline, no node limit)
+until its guessed move is played. check_limits then starts the clock of the search the guess turned into from
+when pondering began: the time the human thought was spent on this move, so after a long think the answer
+comes right away with the deepest iteration the ponder search completed.
+"""
+
+
+def start_clock(search_limits, started=None):
+    global search_start, budget, deadline, node_limit, next_check, pondering, ponder_limits
+    search_start = time.perf_counter() if started is None else started
+    next_check = move_count + CHECK_NODES
+    pondering = bool(search_limits.get("pondering")) and ponder_event is not None and not ponder_event.is_set()
+    ponder_limits = search_limits
+    if pondering:
+        budget, deadline, node_limit = 0, float("inf"), 0
+        return
+    budget = allocate_time(search_limits)
+    deadline = search_start + budget if budget else float("inf")
+    nodes = search_limits.get("nodes", 0)
+    node_limit = move_count + nodes if nodes else 0  # nodes searched while pondering don't count
+
+
+"""
+Runs every CHECK_NODES nodes, ends the search with SearchTimeout when its budget is used up or it is stopped.
+The search unwinds and still answers with its last completed iteration, so stopping loses nothing but the
+iteration in progress.
+"""
+
+
+def check_limits():
+    global next_check
+    next_check = move_count + CHECK_NODES
+    if pondering and ponder_event.is_set():
+        start_clock(ponder_limits, search_start)
+    if time.perf_counter() > deadline or (node_limit and move_count >= node_limit) or \
+            (stop_event is not None and stop_event.is_set()):
+        raise SearchTimeout()
+
+
+"""
+Sends the result of a completed iteration to progress_queue without waiting for anyone to read it
+"""
+
+
+def report_progress(gs, depth, score, best_move):
+    progress_queue.put(("info", progress_tag, depth, score, move_count, round(time.perf_counter() - search_start, 3),
+                        principal_variation(gs, best_move, depth)))
+
+
+"""
+The moves the search expects from gs on, starting with move: the best moves stored in the transposition table,
+followed until the table has none, one is illegal (a key collision) or there are length of them
+"""
+
+
+def principal_variation(gs, move, length):
+    pv = []
+    while move and len(pv) < length:
+        pv.append(move)
+        gs.make_move(move)
+        move = transpositionTable.entry_move(tt.probe(gs.hash))
+        if move and not gs.is_legal(move):
+            move = 0
+    for _ in pv:
+        gs.undo_move()
+    return pv
+
+
+"""
+The reply the last search expects to move, 0 when the table has none. It is what the engine ponders on.
+"""
+
+
+def ponder_move(gs, move):
+    pv = principal_variation(gs, move, 2)
+    return pv[1] if len(pv) > 1 else 0
+
+
+"""
+Times move generation, evaluation and move ordering separately in every search (stats.parts) by wrapping the
+functions of each part, see searchStats. Move ordering is the staged move generator without the move
+generation it calls, plus static exchange evaluation. The wrappers cost more than the work they time in some
+places, so only the proportions mean much.
+"""
+GAME_STATE_PARTS = (("generate_legal_moves", "movegen"), ("has_legal_move", "movegen"), ("is_legal", "movegen"),
+                    ("in_check", "movegen"), ("staged_moves", "ordering"), ("see", "ordering"))
+
+
+def set_part_timing(enabled):
+    global evaluate, part_timing
+    game_state = bitboardEngine.GameState
+    for name, part in GAME_STATE_PARTS:
+        setattr(game_state, name, searchStats.timed(getattr(game_state, name), part if enabled else None))
+    evaluate = searchStats.timed(evaluate, "eval" if enabled else None)
+    part_timing = enabled
+
+
+"""
+Changes the transposition table memory cap, the table is emptied
+"""
+
+
+def set_hash_size(megabytes):
+    global TT_MEGABYTES
+    TT_MEGABYTES = megabytes
+    tt.resize(megabytes)
 
 
 """
 NegaMax Algorithm with Principal Variation Search (PVS)
+Below the root the moves come from gs.staged_moves, so a cutoff on the hash move, a capture or a killer move
+never generates the quiet moves, and the quiet moves come in history order. valid_moves is only given at the root.
+Every searched node is stored in the transposition table, an entry at least as deep as the remaining
+depth ends the search of a repeated position right away (except at the root, which must pick a move).
+The search is selective, each part has its USE_ switch:
+    check extensions    a side in check is searched one ply deeper
+    razoring            one ply from the horizon a position far below alpha only gets the quiescence search
+    null move pruning   if passing the turn still fails high the position is cut, not in check and not
+                        without pieces (zugzwang), never twice in a row (allow_null)
+    futility pruning    one or two plies from the horizon quiet moves can't lift a static score far
+                        below alpha, they are skipped
+    late move reductions    quiet moves late in the order are searched a ply or two shallower first,
+                        and again at full depth when that beats alpha. Checks and moves that threaten
+                        mate (threatens_mate) are never reduced.
+Pruning and the null move are only used in zero window searches (not pv_node), where the exact score
+doesn't matter.
 """
-def find_move_pvs(gs, valid_moves, depth, alpha, beta, turn_multiplier):
-    global next_move, move_count
+def find_move_pvs(gs, depth, alpha, beta, turn_multiplier, ply=0, valid_moves=None, pv_node=True,
+                  allow_null=True):
+    global next_move, move_count, cutoff_count, first_move_cutoffs
+    in_check = gs.in_check()
+    if USE_CHECK_EXTENSIONS and in_check and ply + depth < MAX_PLY - 1:
+        depth += 1
+    if depth <= 0:
+        return quiescence(gs, alpha, beta, turn_multiplier, ply, QUIESCENCE_PLIES)
     move_count += 1
-    if depth == 0:
-        return turn_multiplier * score_board(gs)
-    # move ordering function call
-    ordered_moves = new_order_moves(gs, valid_moves, depth)
+    if move_count >= next_check:
+        check_limits()
+    key = gs.hash
+    entry = tt.probe(key)
+    hash_move = transpositionTable.entry_move(entry) if USE_HASH_MOVE else 0
+    if entry and ply > 0 and transpositionTable.entry_depth(entry) >= depth:
+        score = transpositionTable.entry_score(entry) / TT_SCALE
+        bound = transpositionTable.entry_bound(entry)
+        if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+            return score
+    futile = False
+    if not pv_node and not in_check:
+        static_score = turn_multiplier * evaluate(gs)
+        if USE_RAZORING and depth == 1 and static_score + RAZOR_MARGIN <= alpha:
+            return quiescence(gs, alpha, beta, turn_multiplier, ply, QUIESCENCE_PLIES)
+        if USE_NULL_MOVE and allow_null and depth >= NULL_MOVE_MIN_DEPTH and static_score >= beta and \
+                gs.has_non_pawn_material():
+            reduction = NULL_MOVE_REDUCTION + (depth >= 7)
+            gs.make_null_move()
+            score = -find_move_pvs(gs, depth - 1 - reduction, -beta, -beta + 1, -turn_multiplier, ply + 1, None,
+                                   False, False)
+            gs.undo_move()
+            if score >= beta:
+                return beta if score >= CHECKMATE else score  # a mate after a pass proves nothing
+        if USE_FUTILITY and depth <= 2:
+            futility_score = static_score + FUTILITY_MARGINS[depth]
+            futile = futility_score <= alpha
+    side = 0 if gs.whiteToMove else 1
+    killers = killer_moves[ply] if USE_KILLERS else ()
+    if valid_moves is None:
+        valid_moves = gs.staged_moves(hash_move, killers, history[side] if USE_HISTORY else None)
+    elif hash_move in valid_moves:
+        valid_moves.remove(hash_move)
+        valid_moves.insert(0, hash_move)
+    original_alpha = alpha
     max_score = -CHECKMATE
-    for index, move in enumerate(ordered_moves):
+    best_move = 0
+    searched = 0
+    for move in valid_moves:
+        reduction = 0
+        if searched and not in_check and not move >> 12 & (bitboardEngine.CAPTURE | bitboardEngine.PROMOTION) and \
+                (futile or USE_LMR and depth >= LMR_MIN_DEPTH and searched >= LMR_MIN_MOVES and
+                 move not in killers) and not gs.gives_check(move):
+            if futile:
+                if futility_score > max_score:  # what the skipped move could have scored at most
+                    max_score = futility_score
+                continue
+            reduction = min(1 if searched < LMR_DEEP_MOVES else 2, depth - 2)
         gs.make_move(move)
-        next_moves = gs.get_valid_moves()
-        score = 0
-        if index == 0:
-            score = -find_move_pvs(gs, next_moves, depth - 1, -beta, -alpha, -turn_multiplier)
+        if reduction and threatens_mate(gs):
+            reduction = 0
+        if searched == 0:
+            score = -find_move_pvs(gs, depth - 1, -beta, -alpha, -turn_multiplier, ply + 1, None, pv_node)
         else:
-            score = -find_move_pvs(gs, next_moves, depth - 1, -alpha - 1, -alpha, -turn_multiplier)
+            score = -find_move_pvs(gs, depth - 1 - reduction, -alpha - 1, -alpha, -turn_multiplier, ply + 1, None,
+                                   False)
+            if reduction and score > alpha:
+                score = -find_move_pvs(gs, depth - 1, -alpha - 1, -alpha, -turn_multiplier, ply + 1, None, False)
             if alpha < score < beta:
-                score = -find_move_pvs(gs, next_moves, depth - 1, -beta, -score, -turn_multiplier)
+                score = -find_move_pvs(gs, depth - 1, -beta, -score, -turn_multiplier, ply + 1, None, pv_node)
+        searched += 1
         if score > max_score:
             max_score = score
-            if depth == DEPTH:
+            best_move = move
+            if ply == 0:
                 next_move = move
         gs.undo_move()
         if max_score > alpha:  # pruning happens
             alpha = max_score
         if alpha >= beta:
+            cutoff_count += 1
+            if searched == 1:
+                first_move_cutoffs += 1
+            if not move >> 12 & (bitboardEngine.CAPTURE | bitboardEngine.PROMOTION):
+                record_quiet_cutoff(move, ply, depth, side)
             break
+    if searched == 0:
+        max_score = -CHECKMATE if in_check else STALEMATE
+        tt.store(key, depth, round(max_score * TT_SCALE), EXACT, 0)
+        return max_score
+    if max_score <= original_alpha:
+        bound = UPPER
+    elif max_score >= beta:
+        bound = LOWER
+    else:
+        bound = EXACT
+    tt.store(key, depth, round(max_score * TT_SCALE), bound, best_move)
     return max_score
 
 
-def find_best_move_pvs(gs, valid_moves, return_queue):
-    global next_move, move_count
-    next_move = None
-    random.shuffle(valid_moves)
-    move_count = 0
-    tt = {}
-    find_move_pvs(gs, valid_moves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    print(move_count)
-    return_queue.put(next_move)
+"""
+True when the side that just moved would mate in one (with a capture or a direct check) if the side to move
+passed, a quiet move with a threat like that must not be searched shallower. The side to move must not be in
+check.
+"""
+
+
+def threatens_mate(gs):
+    gs.make_null_move()
+    moves = []
+    gs.generate_legal_moves(moves, bitboardEngine.GEN_CAPTURES)
+    captures = len(moves)
+    gs.generate_quiet_checks(moves)
+    mate = False
+    for index, move in enumerate(moves):
+        if index >= captures or gs.gives_check(move):
+            gs.make_move(move)
+            mate = not gs.has_legal_move()
+            gs.undo_move()
+            if mate:
+                break
+    gs.undo_move()
+    return mate
+
+
+"""
+Capture only search at the horizon so a piece left hanging by the last move is seen. The side to move may
+stand pat on the static score; captures go in MVV-LVA order, losing ones (negative static exchange) and ones
+that can't reach alpha even with DELTA_MARGIN to spare are skipped. The first ply (plies_left is
+QUIESCENCE_PLIES) also tries the quiet moves that give check directly, unpruned, so a quiet mate right at
+the horizon isn't missed.
+In check every evasion is searched. plies_left bounds the depth.
+"""
+
+
+def quiescence(gs, alpha, beta, turn_multiplier, ply, plies_left):
+    global move_count, qnode_count
+    move_count += 1
+    qnode_count += 1
+    if move_count >= next_check:
+        check_limits()
+    if not gs.has_legal_move():
+        return -CHECKMATE if gs.inCheck else STALEMATE
+    stand_pat = turn_multiplier * score_board(gs)
+    if plies_left == 0 or ply >= MAX_PLY - 1:
+        return stand_pat
+    moves = []
+    in_check = gs.inCheck  # the flag changes while the moves below are searched
+    if in_check:
+        gs.generate_legal_moves(moves)
+        max_score = -CHECKMATE
+    else:
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        gs.generate_legal_moves(moves, bitboardEngine.GEN_CAPTURES)
+        max_score = stand_pat
+    moves.sort(key=bitboardEngine.capture_order, reverse=True)
+    captures = len(moves)
+    if not in_check and plies_left == QUIESCENCE_PLIES:
+        gs.generate_quiet_checks(moves)
+    for index, move in enumerate(moves):
+        if not in_check and index < captures:
+            captured = move >> 20 & 15
+            gain = piece_values[captured % 6] if captured != bitboardEngine.EMPTY else 0
+            if bitboardEngine.is_promotion(move):
+                gain += piece_values[bitboardEngine.KNIGHT + (move >> 12 & 3)] - 1
+            if stand_pat + gain + DELTA_MARGIN <= alpha or gs.see(move) < 0:
+                continue
+        gs.make_move(move)
+        score = -quiescence(gs, -beta, -alpha, -turn_multiplier, ply + 1, plies_left - 1)
+        gs.undo_move()
+        if score > max_score:
+            max_score = score
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+    return max_score
+
+
+def find_best_move_pvs(gs, valid_moves, return_queue, search_limits=None):
+    find_best_move(gs, valid_moves, return_queue, search_limits)
 
 
 """
@@ -156,28 +606,7 @@ def score_board(gs):
             return CHECKMATE  # white wins
     if gs.staleMate:
         return STALEMATE
-    score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-            if square != "--":
-                piece_position_score = 0
-                if square[1] == 'p':
-                    piece_position_score = piece_position_scores[square][row][col]
-                else:
-                    piece_position_score = piece_position_scores[square[1]][row][col]
-                if square[0] == 'w':
-                    if square[1] == 'K':
-                        score += piece_score[square[1]] * 10 + piece_position_score * .1
-                    else:
-                        score += piece_score[square[1]] + piece_position_score * .1
-                elif square[0] == 'b':
-                    if square[1] == 'K':
-                        score -= piece_score[square[1]] * 10 + piece_position_score * .1
-                    else:
-                        score -= piece_score[square[1]] + piece_position_score * .1
-    pawn_structure_score = evaluate_pawn_structure(gs)
-    score += pawn_structure_score
+    score = evaluate(gs)
     if gs.inCheck:
         if gs.whiteToMove:
             score -= 0.5
@@ -186,121 +615,96 @@ def score_board(gs):
     return score
 
 
-# move ordering
+"""
+Static score for white without the terminal and check terms of score_board: material and piece position, kept
+up to date by the engine, and the pawn structure
+"""
 
 
-def new_order_moves(gs, valid_moves, depth):
-    if len(gs.killer_moves) > MAX_KILLER_MOVES:
-        oldest_moves = sorted(gs.killer_moves, key=lambda move: gs.moveLog.index(move))[0:MAX_KILLER_MOVES // 2]
-        for move in oldest_moves:
-            gs.killer_moves.remove(move)
+def evaluate(gs):
+    return gs.pieceSquareScore / 100 + evaluate_pawn_structure(gs)
 
-    # Technique 1: Order checkmate moves first
-    scored_moves = []
-    checkmate_moves = []
-    for move in valid_moves:
-        gs.make_move(move)
-        if gs.checkMate:
-            checkmate_moves.append((move, depth))
-        else:
-            score = score_board(gs)
-            scored_moves.append((move, score))
-        gs.undo_move()
 
-    if checkmate_moves:
-        checkmate_moves.sort(key=lambda move: move[1])
-        ordered_moves = [move_tuple[0] for move_tuple in checkmate_moves]
-    else:
-        # Technique 2: Order captures before other moves
-        capture_moves = []
-        for move in scored_moves:
-            if gs.board != "--":
-                capture_moves.append(move)
-                scored_moves.remove(move)
-        capture_moves.sort(key=lambda x: x[1], reverse=True)
-        scored_moves.sort(key=lambda x: x[1], reverse=True)
-
-    # Technique 3: Use history heuristic to order non-capture moves
-        history_moves = []
-        for move in scored_moves:
-            if gs.moveLog:
-                for i in range(0, len(gs.moveLog), 2):
-                    if move[0] == gs.moveLog[i]:
-                        history_moves.append(move)
-                        scored_moves.remove(move)
-                        break
-        history_moves.sort(key=lambda x: x[1], reverse=True)
-        scored_moves.sort(key=lambda x: x[1], reverse=True)
-
-        # Technique 4: Use killer moves to order non-capture moves
-        killer_moves_list = list(gs.killer_moves)
-        for move in scored_moves:
-            if move[0] in gs.killer_moves:
-                killer_moves_list.append(move[0])
-                scored_moves.remove(move)
-        killer_moves_list.sort(key=lambda x: x[1], reverse=True)
-        scored_moves.sort(key=lambda x: x[1], reverse=True)
-
-        # Combine all ordered move lists
-        ordered_moves = [move_tuple[0] for move_tuple in capture_moves + history_moves + scored_moves]
-
-    return ordered_moves
+# pawn structure
+# pawn structure evaluation, from the pawn bitboards only so the score can be cached by gs.pawnHash
+ISOLATED_PAWN = 0.5
+DOUBLED_PAWN = 0.25  # for every pawn beyond the first on a file
+BACKWARD_PAWN = 0.25
+SUPPORTED_PAWN = 0.1  # defended by a pawn of its own side
+PASSED_PAWN = (0, 0.1, 0.2, 0.35, 0.6, 1.0, 1.5)  # by number of ranks advanced from the start rank
+PAWN_TABLE_ENTRIES = 1 << 14
+pawn_table = transpositionTable.PawnHashTable(PAWN_TABLE_ENTRIES)
+
+
+def _pawn_masks():
+    files = [bitboardEngine.FILE_A << col for col in range(8)]
+    adjacent = [(files[col - 1] if col > 0 else 0) | (files[col + 1] if col < 7 else 0) for col in range(8)]
+    # passed[color][square]: enemy pawns here stop a pawn of color on square from being passed
+    # behind[color][square]: own pawns here (adjacent files, level or behind) could still support it
+    passed = [[0] * 64, [0] * 64]
+    behind = [[0] * 64, [0] * 64]
+    for square in range(64):
+        row, col = divmod(square, 8)
+        for other in range(64):
+            other_row, other_col = divmod(other, 8)
+            bit = 1 << other
+            if abs(other_col - col) <= 1:
+                if other_row < row:
+                    passed[bitboardEngine.WHITE][square] |= bit
+                elif other_row > row:
+                    passed[bitboardEngine.BLACK][square] |= bit
+            if abs(other_col - col) == 1:
+                if other_row >= row:
+                    behind[bitboardEngine.WHITE][square] |= bit
+                if other_row <= row:
+                    behind[bitboardEngine.BLACK][square] |= bit
+    return files, adjacent, passed, behind
+
+
+FILE_MASKS, ADJACENT_FILES, PASSED_MASKS, BEHIND_MASKS = _pawn_masks()
+
+"""
+Pawn structure score, positive is good for white. Looked up in pawn_table by the pawn key first.
+"""
 
 
-# pawn structure
-# pawn structure evaluation
 def evaluate_pawn_structure(gs):
+    score = pawn_table.probe(gs.pawnHash)
+    if score is None:
+        score = compute_pawn_structure(gs.pieces[bitboardEngine.PAWN], gs.pieces[6 + bitboardEngine.PAWN])
+        pawn_table.store(gs.pawnHash, score)
+    return score
+
+
+def compute_pawn_structure(white_pawns, black_pawns):
     score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-            if square == 'wp':
-                # Isolated pawn penalty
-                if col > 0 and gs.board[row][col - 1] != 'wp' and gs.board[row + 1][col - 1] != 'wp' and \
-                        gs.board[row - 1][col - 1] != 'wp':
-                    score -= 0.5
-                elif col < 7 and gs.board[row][col + 1] != 'wp' and gs.board[row + 1][col + 1] != 'wp' and \
-                        gs.board[row - 1][col + 1] != 'wp':
-                    score -= 0.5
-
-                # Passed pawn bonus
-                if row >= 5 and gs.board[row - 1][col] == '--' and gs.board[row - 2][col] == '--' and \
-                        gs.board[row - 3][col] == '--':
-                    score += 1
-
-                # Pawn chain bonus
-                if row >= 1 and gs.board[row - 1][col] == 'wp':
-                    if row >= 2 and gs.board[row - 2][col] == 'wp':
-                        if row >= 3 and gs.board[row - 3][col] == 'wp':
-                            score += 1
-                        else:
-                            score += 0.5
-                    else:
-                        score += 0.25
-
-            elif square == 'bp':
-                # Isolated pawn penalty
-                if col > 0 and gs.board[row][col - 1] != 'bp' and gs.board[row + 1][col - 1] != 'bp' and \
-                        gs.board[row - 1][col - 1] != 'bp':
-                    score += 0.5
-                elif col < 7 and gs.board[row][col + 1] != 'bp' and gs.board[row + 1][col + 1] != 'bp' and \
-                        gs.board[row - 1][col + 1] != 'bp':
-                    score += 0.5
-
-                # Passed pawn bonus
-                if row <= 2 and gs.board[row + 1][col] == '--' and gs.board[row + 2][col] == '--' and \
-                        gs.board[row + 3][col] == '--':
-                    score -= 1
-
-                # Pawn chain bonus
-                if row <= 6 and gs.board[row + 1][col] == 'bp':
-                    if row <= 5 and gs.board[row + 2][col] == 'bp':
-                        if row <= 4 and gs.board[row + 3][col] == 'bp':
-                            score -= 1
-                        else:
-                            score -= 0.5
-                    else:
-                        score -= 0.25
+    for color, own, enemy, sign in ((bitboardEngine.WHITE, white_pawns, black_pawns, 1),
+                                    (bitboardEngine.BLACK, black_pawns, white_pawns, -1)):
+        forward = -8 if color == bitboardEngine.WHITE else 8
+        enemy_attacks = bitboardEngine.PAWN_ATTACKS[color]  # an enemy pawn on these squares attacks the square
+        own_attacks = bitboardEngine.PAWN_ATTACKS[color ^ 1]  # an own pawn on these squares defends it
+        for col in range(8):
+            on_file = bitboardEngine.popcount(own & FILE_MASKS[col])
+            if on_file > 1:
+                score -= sign * DOUBLED_PAWN * (on_file - 1)
+        pawns = own
+        while pawns:
+            square = bitboardEngine.lsb(pawns)
+            pawns &= pawns - 1
+            col = square & 7
+            if not own & ADJACENT_FILES[col]:
+                score -= sign * ISOLATED_PAWN
+            elif not own & BEHIND_MASKS[color][square] and enemy_attacks[square + forward] & enemy:
+                score -= sign * BACKWARD_PAWN  # nothing can come up to support it and its stop square is covered
+            if own_attacks[square] & own:
+                score += sign * SUPPORTED_PAWN
+            if not enemy & PASSED_MASKS[color][square]:
+                advanced = 6 - (square >> 3) if color == bitboardEngine.WHITE else (square >> 3) - 1
+                score += sign * PASSED_PAWN[advanced]
     return score
 
 
+if searchStats.timing_requested():
+    set_part_timing(True)
+if engineProfile.requested():
+    engineProfile.enable(engineProfile.requested())
@@ -112,7 +112,7 @@ class GameState:
             # set the current castle rights to the last one in the list
             castle_rights = self.castleRightsLog[-1]
             self.currentCastleRights = CastleRights(castle_rights.wks, castle_rights.bks,
-                                                    castle_rights.wqs, castle_rights.wqs)
+                                                    castle_rights.wqs, castle_rights.bqs)
             # undo castle move
             if move.is_castle_move:
                 if move.end_cols - move.start_cols == 2:  # king side castle move
@@ -227,13 +227,41 @@ class GameState:
         self.currentCastleRights = temp_castle_rights
         return moves
 
+    """
+    Returns if the enemy attacks the square, looking outward from the square for pieces that could reach it
+    """
+
     def square_under_attack(self, row, col):
-        self.whiteToMove = not self.whiteToMove
-        opp_moves = self.get_all_possible_moves()
-        self.whiteToMove = not self.whiteToMove
-        for move in opp_moves:
-            if move.end_row == row and move.end_cols == col:
+        enemy_color = 'b' if self.whiteToMove else 'w'
+        # pawns attack diagonally forward, so an enemy pawn sits one row behind the square from its point of view
+        pawn_row = row - 1 if enemy_color == 'b' else row + 1
+        if 0 <= pawn_row < 8:
+            for pawn_col in (col - 1, col + 1):
+                if 0 <= pawn_col < 8 and self.board[pawn_row][pawn_col] == enemy_color + 'p':
+                    return True
+        knight_moves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        for k in knight_moves:
+            end_row = row + k[0]
+            end_col = col + k[1]
+            if 0 <= end_row < 8 and 0 <= end_col < 8 and self.board[end_row][end_col] == enemy_color + 'N':
                 return True
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(len(directions)):
+            d = directions[j]
+            for i in range(1, 8):
+                end_row = row + d[0] * i
+                end_col = col + d[1] * i
+                if not (0 <= end_row < 8 and 0 <= end_col < 8):
+                    break
+                end_piece = self.board[end_row][end_col]
+                if end_piece == "--":
+                    continue
+                if end_piece[0] == enemy_color:
+                    piece_type = end_piece[1]
+                    if piece_type == 'Q' or (piece_type == 'R' and j <= 3) or (piece_type == 'B' and j >= 4) or \
+                            (piece_type == 'K' and i == 1):
+                        return True
+                break
         return False
 
     """ALL MOVES NOT CONSIDERING CHECKS"""
@@ -680,4 +708,4 @@ class Move:
         return move_string + end_square
 
     def __hash__(self):
-        return hash(str(self))
+        return self.move_id  # consistent with __eq__ and doesn't build the notation string
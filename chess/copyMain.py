@@ -1,9 +1,10 @@
 import pygame as pg
 import pygame_gui
 from pygame_gui.elements import UIButton
-from multiprocessing import Queue, Process
-import copyEngine
+import bitboardEngine
 import chessAI
+import engineWorker
+import searchStats
 import cv2
 import numpy as np
 
@@ -29,12 +30,7 @@ BLACK = pg.Color("black")
 GOLDENROD = pg.Color("goldenrod")
 
 def initialize_game(difficulty):
-    if difficulty == "Easy":
-        chessAI.MAX_DEPTH = 2
-    elif difficulty == "Intermediate":
-        chessAI.MAX_DEPTH = 3
-    elif difficulty == "Hard":
-        chessAI.MAX_DEPTH = 4
+    chessAI.set_difficulty(difficulty)
 
 def load_images():
     pieces = ["wp", "bp", "wR", "bR", "wN", "bN", "wB", "bB", "wQ", "bQ", "wK", "bK"]
@@ -81,7 +77,7 @@ def main():
     screen = pg.display.set_mode((BOARD_WIDTH + MOVE_LOG_WIDTH, BOARD_HEIGHT))
     clock = pg.time.Clock()
     screen.fill(WHITE)
-    gs = copyEngine.GameState()
+    gs = bitboardEngine.GameState()
     valid_moves = gs.get_valid_moves()
     move_log_font = pg.font.SysFont("Arial", 15, True, False)
     move_made = False
@@ -97,7 +93,9 @@ def main():
     player_one = True
     player_two = False
     ai_thinking = False
-    move_finder_process = None
+    engine = engineWorker.EngineWorker()  # one search process for the whole session, it keeps its tables warm
+    search_id = 0  # id of the engine search whose answers are wanted, 0 for none
+    thinking = []  # lines about the engine's last completed iteration, shown under the move log
     move_undone = False
 
     gui_manager = pygame_gui.UIManager((BOARD_WIDTH + MOVE_LOG_WIDTH, BOARD_HEIGHT))
@@ -173,19 +171,26 @@ def main():
                         sq_selected = (row, cols)
                         player_clicks.append(sq_selected)
                     if len(player_clicks) == 2 and human_turn:
-                        move = copyEngine.Move(player_clicks[0], player_clicks[1], gs.board)
-                        print(move.get_chess_notation())
-                        for i in range(len(valid_moves)):
-                            if move == valid_moves[i]:
-                                if move.piece_captured != "--":
-                                    pg.mixer.Sound.play(SOUNDS["capture"])
+                        move = bitboardEngine.find_move(valid_moves, player_clicks[0], player_clicks[1])
+                        if move is not None:
+                            print(bitboardEngine.to_move(move).get_chess_notation())
+                            if bitboardEngine.is_capture(move):
+                                pg.mixer.Sound.play(SOUNDS["capture"])
+                            else:
+                                pg.mixer.Sound.play(SOUNDS["move-self"])
+                            gs.make_move(move)
+                            if engine.pondering:
+                                if move == engine.pondering:  # the engine has been searching this position
+                                    print("ponder hit")
+                                    engine.ponder_hit()
+                                    ai_thinking = True
                                 else:
-                                    pg.mixer.Sound.play(SOUNDS["move-self"])
-                                gs.make_move(valid_moves[i])
-                                move_made = True
-                                animate = True
-                                sq_selected = ()
-                                player_clicks = []
+                                    engine.stop()
+                                    search_id = 0
+                            move_made = True
+                            animate = True
+                            sq_selected = ()
+                            player_clicks = []
                         if not move_made:
                             player_clicks = [sq_selected]
             elif e.type == pg.KEYDOWN:
@@ -196,12 +201,12 @@ def main():
                     game_over = False
                     draw_sound_played = False
                     game_over_sound_played = False
-                    if ai_thinking:
-                        move_finder_process.terminate()
-                        ai_thinking = False
+                    engine.stop()  # a search or ponder answer is for a position that is gone
+                    search_id = 0
+                    ai_thinking = False
                     move_undone = True
                 if e.key == pg.K_r:
-                    gs = copyEngine.GameState()
+                    gs = bitboardEngine.GameState()
                     valid_moves = gs.get_valid_moves()
                     sq_selected = ()
                     player_clicks = []
@@ -210,41 +215,55 @@ def main():
                     game_over = False
                     draw_sound_played = False
                     game_over_sound_played = False
-                    if ai_thinking:
-                        move_finder_process.terminate()
-                        ai_thinking = False
+                    engine.new_game()
+                    search_id = 0
+                    ai_thinking = False
                     move_undone = True
 
+        answer = None
+        response = engine.poll()
+        while response is not None:  # never waits, answers of stopped searches are dropped
+            if response[1] == search_id:
+                if response[0] == "info":
+                    thinking = thinking_lines(response)
+                else:
+                    answer = response
+            response = engine.poll()
+
         if not game_over and not human_turn and not move_undone:
             if not ai_thinking:
                 ai_thinking = True
                 print("thinking...")
-                return_queue = Queue()
-                move_finder_process = Process(target=chessAI.find_best_move, args=(gs, valid_moves, return_queue))
-                move_finder_process.start()
-
-            if not move_finder_process.is_alive():
-                print("Done Thinking")
-                ai_move = return_queue.get()
+                engine.set_position(gs)
+                search_id = engine.go(chessAI.limits)
+                thinking = []
+            elif answer is not None:
+                print("Done Thinking", searchStats.summary(answer[7]) if answer[7] else "")
+                ai_move = answer[2]
                 if ai_move is None:
                     ai_move = chessAI.find_random_move(valid_moves)
                 gs.make_move(ai_move)
                 move_made = True
                 animate = True
                 ai_thinking = False
+                human_next = (gs.whiteToMove and player_one) or (not gs.whiteToMove and player_two)
+                if chessAI.limits.get("ponder") and human_next and answer[6]:
+                    search_id = engine.ponder(gs, answer[6], chessAI.limits)
+                    thinking = []
 
         if move_made:
             if animate:
-                animate_move(gs.moveLog[-1], screen, gs.board, clock)
+                animate_move(bitboardEngine.to_move(gs.moveLog[-1]), screen, gs.board, clock)
             valid_moves = gs.get_valid_moves()
             move_made = False
             animate = False
             move_undone = False
 
         draw_game_state(screen, gs, valid_moves, sq_selected, gs.whiteKingLocation, gs.blackKingLocation, move_log_font)
+        draw_thinking(screen, thinking, move_log_font)
 
-        if gs.inCheck:
-            if gs.checkMate:
+        if not valid_moves:
+            if gs.in_check():
                 game_over = True
                 if not game_over_sound_played:
                     pg.mixer.Sound.play(SOUNDS["game_over"])
@@ -253,14 +272,15 @@ def main():
                     draw_end_game_text(screen, "Black Wins")
                 else:
                     draw_end_game_text(screen, "White Wins")
-        if gs.staleMate:
-            if not draw_sound_played:
-                pg.mixer.Sound.play(SOUNDS["draw"])
-                pg.time.delay(100)
-                draw_sound_played = True
-            game_over = True
-            draw_end_game_text(screen, "Draw")
+            else:
+                if not draw_sound_played:
+                    pg.mixer.Sound.play(SOUNDS["draw"])
+                    pg.time.delay(100)
+                    draw_sound_played = True
+                game_over = True
+                draw_end_game_text(screen, "Draw")
         pg.display.flip()
+    engine.close()
 
 def highlight_square(screen, gs, valid_moves, sq_selected):
     if sq_selected != ():
@@ -273,8 +293,9 @@ def highlight_square(screen, gs, valid_moves, sq_selected):
             s.set_alpha(150)
             s.fill(GOLDENROD)
             for move in valid_moves:
-                if move.start_row == row and move.start_cols == col:
-                    screen.blit(s, (move.end_cols * SQ_SIZE, move.end_row * SQ_SIZE))
+                if bitboardEngine.move_start(move) == row * 8 + col:
+                    end_row, end_col = divmod(bitboardEngine.move_end(move), 8)
+                    screen.blit(s, (end_col * SQ_SIZE, end_row * SQ_SIZE))
 
 def check(screen, w_location, b_location, gs):
     if gs.inCheck:
@@ -340,7 +361,7 @@ def animate_move(move, screen, board, clock):
 def draw_move_log(screen, gs, font):
     move_log_rect = pg.Rect(BOARD_WIDTH, 0, MOVE_LOG_WIDTH, MOVE_LOG_HEIGHT)
     pg.draw.rect(screen, BLACK, move_log_rect)
-    move_log = gs.moveLog
+    move_log = [bitboardEngine.to_move(move) for move in gs.moveLog]  # built only for the notation
     move_texts = []
     for i in range(0, len(move_log), 2):
         move_string = str(i // 2 + 1) + "." + str(move_log[i]) + " "
@@ -361,6 +382,20 @@ def draw_move_log(screen, gs, font):
         screen.blit(text_object, text_location)
         text_y += text_object.get_height() + line_spacing
 
+def thinking_lines(info):
+    depth, score, nodes, seconds, pv = info[2:]
+    nps = int(nodes / seconds) if seconds > 0 else 0
+    return ["depth %d  score %+.2f" % (depth, score), "%d nodes  %d n/s" % (nodes, nps),
+            " ".join(str(bitboardEngine.to_move(move)) for move in pv[:6])]
+
+def draw_thinking(screen, lines, font):
+    padding = 5
+    text_y = MOVE_LOG_HEIGHT - padding
+    for line in reversed(lines):
+        text_object = font.render(line, True, WHITE)
+        text_y -= text_object.get_height()
+        screen.blit(text_object, (BOARD_WIDTH + padding, text_y))
+
 def draw_end_game_text(screen, text):
     font = pg.font.SysFont("arial", 32, True, False)
     text_object = font.render(text, False, BLACK)
@@ -0,0 +1,108 @@
+"""
+Opt-in profiling of the engine, in two parts:
+    counters    every call of the hot functions in HOOKS is counted and timed (cumulative time, including the
+                functions it calls), the totals are printed when the process exits. The wrappers are
+                searchStats.timed, the ones part timing uses, so a function timed by both has a single wrapper
+    cprofile    every chessAI.search runs under cProfile and writes its profile to
+                PROFILE_DIR/move-<game ply>-<process id>-<search>.prof, one file per search, search counting
+                the searches of the process
+Switched on with the CHESS_PROFILE environment variable (counters, cprofile or both separated by a comma),
+which the engine and Lazy SMP processes inherit, or with enable() (bench.py --profile). Nothing is wrapped
+while it is off, so the search runs exactly the code it runs without this module.
+Read a profile with: python -m pstats profiles/move-012-4242-3.prof
+"""
+import atexit
+import cProfile
+import importlib
+import os
+import sys
+
+import searchStats
+
+MODES = ("counters", "cprofile")
+# (module, class or None, function), chessAI.find_move_pvs and quiescence are recursive and left out, their
+# cumulative time would count every level again
+HOOKS = [
+    ("bitboardEngine", "GameState", "get_valid_moves"),
+    ("bitboardEngine", "GameState", "generate_legal_moves"),
+    ("bitboardEngine", "GameState", "has_legal_move"),
+    ("bitboardEngine", "GameState", "pinned_pieces"),
+    ("bitboardEngine", "GameState", "attackers_to"),
+    ("bitboardEngine", "GameState", "staged_moves"),
+    ("bitboardEngine", "GameState", "see"),
+    ("bitboardEngine", "GameState", "make_move"),
+    ("bitboardEngine", "GameState", "undo_move"),
+    ("chessAI", None, "score_board"),
+    ("chessAI", None, "evaluate_pawn_structure"),
+    ("chessAI", None, "search"),
+]
+PROFILE_DIR = os.environ.get("CHESS_PROFILE_DIR", "profiles")
+calls = searchStats.counter_calls
+seconds = searchStats.counter_seconds
+enabled = set()
+profiles_written = 0
+
+
+def requested():
+    return [mode.strip() for mode in os.environ.get("CHESS_PROFILE", "").split(",") if mode.strip() in MODES]
+
+
+def _owner(module_name, class_name):
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name) if class_name else module
+
+
+def _profiled_search(search):
+    def wrapper(gs, *args):
+        global profiles_written
+        profile = cProfile.Profile()
+        game_ply = gs.plyOffset + gs.ply
+        profile.enable()
+        try:
+            return search(gs, *args)
+        finally:
+            profile.disable()
+            profiles_written += 1
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profile.dump_stats(os.path.join(PROFILE_DIR, "move-%03d-%d-%d.prof" % (game_ply, os.getpid(),
+                                                                                   profiles_written)))
+    return wrapper
+
+
+"""
+Switches the modes on, modes is a list of MODES. Each mode is only installed once.
+"""
+
+
+def enable(modes):
+    if "counters" in modes and "counters" not in enabled:
+        for module_name, class_name, function_name in HOOKS:
+            owner = _owner(module_name, class_name)
+            name = ".".join(part for part in (module_name, class_name, function_name) if part)
+            setattr(owner, function_name, searchStats.timed(getattr(owner, function_name), counter=name))
+        atexit.register(print_report)
+        enabled.add("counters")
+    if "cprofile" in modes and "cprofile" not in enabled:
+        chessAI = importlib.import_module("chessAI")
+        chessAI.search = _profiled_search(chessAI.search)
+        enabled.add("cprofile")
+
+
+"""
+Call counts and cumulative seconds per hooked function, slowest first
+"""
+
+
+def report():
+    return [{"function": name, "calls": calls[name], "seconds": round(seconds[name], 4),
+             "microseconds_per_call": round(seconds[name] / calls[name] * 1e6, 2) if calls[name] else 0.0}
+            for name in sorted(seconds, key=seconds.get, reverse=True)]
+
+
+def print_report(out=sys.stderr):
+    if not any(calls.values()):  # a process that didn't search, like the GUI
+        return
+    out.write("%-50s %10s %10s %10s\n" % ("function", "calls", "seconds", "us/call"))
+    for line in report():
+        out.write("%-50s %10d %10.3f %10.2f\n" % (line["function"], line["calls"], line["seconds"],
+                                                  line["microseconds_per_call"]))
@@ -0,0 +1,171 @@
+"""
+Long lived search process for the GUI.
+One process is started per game window and keeps chessAI's transposition table, history and killers between
+moves, so nothing has to be rebuilt and the next search starts from what the last one learned.
+The transposition table lives in shared memory so Lazy SMP helpers (levels with more than one worker) fill
+the same table. They are started by the first such search and stay attached to the table for the following
+ones (a lazySMP.WorkerPool). Their searches start from this process's history and killers, and Lazy SMP worker 0
+hands its tables back when it is done.
+Commands go to the process as tuples on a queue:
+    ("position", snapshot)      position to search next, a bitboardEngine snapshot
+    ("go", search_id, limits)   search it, answered with
+                                ("bestmove", search_id, move, score, depth, nodes, ponder, stats)
+                                where ponder is the reply the search expects, 0 when it has none, and stats
+                                the searchStats.SearchStats dict of the search (None if it failed). Every
+                                completed iteration is reported before that with
+                                ("info", search_id, depth, score, nodes, seconds, pv)
+    ("newgame",)                forget everything learned in the previous game
+    ("quit",)
+Stopping a running search goes around the queue (the process is busy searching): EngineWorker.stop sets a
+shared event the search checks, and the search still answers with the move of its last completed iteration.
+Pondering works the same way. EngineWorker.ponder starts a search of the position after the expected reply
+while the human thinks, without a time limit. If the human plays that move, ponder_hit sets a second event and
+the search carries on as the normal search of that position, the time spent pondering counting against its
+budget; otherwise it is stopped and its answer ignored, the table it filled stays for the real search.
+"""
+import atexit
+import traceback
+from multiprocessing import Event, Process, Queue, Value
+from multiprocessing.shared_memory import SharedMemory
+from queue import Empty
+
+import bitboardEngine
+import chessAI
+import engineProfile
+import lazySMP
+import transpositionTable
+
+
+def _serve(commands, responses, stop_event, stopped_id, ponder_event, megabytes):
+    memory = SharedMemory(create=True, size=transpositionTable.table_bytes(megabytes))
+    chessAI.tt.detach()
+    chessAI.tt = transpositionTable.TranspositionTable(buffer=memory.buf)
+    chessAI.stop_event = stop_event
+    chessAI.ponder_event = ponder_event
+    chessAI.progress_queue = responses
+    gs = bitboardEngine.GameState()
+    helpers = None
+    try:
+        while True:
+            command = commands.get()
+            if command[0] == "position":
+                gs = bitboardEngine.from_snapshot(command[1])
+            elif command[0] == "go":
+                search_id, search_limits = command[1], command[2]
+                with stopped_id.get_lock():
+                    if search_id > stopped_id.value:  # otherwise the stop came in before the search started
+                        stop_event.clear()
+                chessAI.progress_tag = search_id
+                try:
+                    if search_limits.get("workers", 1) > 1:
+                        if helpers is None:
+                            helpers = lazySMP.WorkerPool(memory.name, stop_event, ponder_event, responses)
+                        move, score, depth, nodes = helpers.search(gs.snapshot(), search_limits,
+                                                                   table_age=chessAI.tt.age, progress_tag=search_id)
+                        chessAI.tt.new_search()  # keep the owner's age in step with the helpers
+                        stats = lazySMP.stats
+                    else:
+                        move, score, depth = chessAI.search(gs, gs.get_valid_moves(), search_limits)
+                        nodes = chessAI.move_count
+                        stats = chessAI.stats.as_dict()
+                except Exception:  # answer anyway, the GUI falls back to a random move
+                    traceback.print_exc()
+                    move, score, depth, nodes, stats = None, 0, 0, 0, None
+                ponder = chessAI.ponder_move(gs, move) if move else 0
+                responses.put(("bestmove", search_id, move, score, depth, nodes, ponder, stats))
+            elif command[0] == "newgame":
+                chessAI.new_game()
+            elif command[0] == "quit":
+                break
+    finally:
+        if helpers is not None:
+            helpers.close()
+        chessAI.tt.detach()
+        memory.close()
+        memory.unlink()
+        if "counters" in engineProfile.enabled:  # atexit doesn't run in a multiprocessing child
+            engineProfile.print_report()
+
+
+"""
+GUI side handle of the search process
+"""
+
+
+class EngineWorker:
+    def __init__(self, megabytes=chessAI.TT_MEGABYTES):
+        self.commands = Queue()
+        self.responses = Queue()
+        self.stop_event = Event()
+        self.stopped_id = Value("i", 0)  # newest search id a stop was sent for
+        self.ponder_event = Event()
+        self.search_id = 0
+        self.pondering = 0  # the reply the running ponder search guessed, 0 when not pondering
+        # not a daemon, Lazy SMP levels start helper processes from it
+        self.process = Process(target=_serve, args=(self.commands, self.responses, self.stop_event,
+                                                    self.stopped_id, self.ponder_event, megabytes))
+        self.process.start()
+        atexit.register(self.close)  # runs before multiprocessing waits for its children at exit
+
+    def set_position(self, gs):
+        self.commands.put(("position", gs.snapshot()))
+
+    """
+    Starts searching the last position sent, returns the id the answer will carry
+    """
+
+    def go(self, search_limits):
+        self.search_id += 1
+        self.commands.put(("go", self.search_id, search_limits))
+        return self.search_id
+
+    """
+    Searches the position after the expected reply move on gs until ponder_hit or stop, returns the id the
+    answer will carry
+    """
+
+    def ponder(self, gs, move, search_limits):
+        gs.make_move(move)
+        self.set_position(gs)
+        gs.undo_move()
+        self.ponder_event.clear()
+        search_id = self.go(dict(search_limits, pondering=True))
+        self.pondering = move
+        return search_id
+
+    """
+    The guessed reply was played, the ponder search becomes the search for the next move
+    """
+
+    def ponder_hit(self):
+        self.pondering = 0
+        self.ponder_event.set()
+
+    def stop(self):
+        self.pondering = 0
+        with self.stopped_id.get_lock():
+            self.stopped_id.value = self.search_id
+            self.stop_event.set()
+
+    def new_game(self):
+        self.stop()
+        self.commands.put(("newgame",))
+
+    """
+    Returns the next answer without waiting, None when there is none yet
+    """
+
+    def poll(self):
+        try:
+            return self.responses.get_nowait()
+        except Empty:
+            return None
+
+    def close(self):
+        if not self.process.is_alive():
+            return
+        self.stop()
+        self.commands.put(("quit",))
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.terminate()
@@ -0,0 +1,97 @@
+"""
+Fuzz check for make_move / undo_move.
+Plays random games on bitboardEngine.GameState and on the original copyEngine.GameState side by side,
+randomly taking moves back as well, and checks after every step that both agree on the board, side to move,
+castle rights and en passant square. Every position must also hash to its Zobrist and pawn keys from scratch
+and carry the piece-square score computed from scratch, and the game must unwind to exactly the start position.
+Null moves (passing the turn, used by the search) are made and taken back along the way, and gives_check must
+agree with making every legal move and looking.
+Usage: python fuzzEngine.py [games] [seed]
+"""
+import random
+import sys
+
+import bitboardEngine
+import copyEngine
+
+
+def castle_tuple(rights):
+    return rights.wks, rights.bks, rights.wqs, rights.bqs
+
+
+def compare(reference, state, where):
+    problems = []
+    if reference.board != state.board:
+        problems.append("board")
+    if reference.whiteToMove != state.whiteToMove:
+        problems.append("side to move")
+    if castle_tuple(reference.currentCastleRights) != castle_tuple(state.currentCastleRights):
+        problems.append("castle rights")
+    if reference.enPassantPossible != state.enPassantPossible:
+        problems.append("en passant")
+    if state.hash != state.compute_hash():
+        problems.append("zobrist key")
+    if state.pawnHash != state.compute_pawn_hash():
+        problems.append("pawn key")
+    if state.pieceSquareScore != state.compute_piece_square_score():
+        problems.append("piece-square score")
+    if problems:
+        raise AssertionError("%s: %s differ after %s" % (where, ", ".join(problems),
+                                                          " ".join(str(bitboardEngine.to_move(move))
+                                                                   for move in state.moveLog)))
+
+
+def fuzz_game(rng, max_plies=200):
+    reference = copyEngine.GameState()
+    state = bitboardEngine.GameState()
+    start_hash = state.hash
+    for ply in range(max_plies):
+        # only play moves both engines generate, the original engine only promotes to a queen
+        reference_moves = {(move.start_row * 8 + move.start_cols, move.end_row * 8 + move.end_cols): move
+                           for move in reference.get_valid_moves()}
+        moves = [move for move in state.get_valid_moves()
+                 if (bitboardEngine.move_start(move), bitboardEngine.move_end(move)) in reference_moves and
+                 (not bitboardEngine.is_promotion(move) or
+                  bitboardEngine.move_flag(move) & 3 == bitboardEngine.QUEEN - bitboardEngine.KNIGHT)]
+        if not moves:
+            break
+        for move in moves:
+            state.make_move(move)
+            check = state.in_check()
+            state.undo_move()
+            if state.gives_check(move) != check:
+                raise AssertionError("gives_check wrong for %s at ply %d" % (bitboardEngine.to_uci(move), ply))
+        if state.moveLog and rng.random() < 0.2:  # take back a few moves
+            for _ in range(rng.randint(1, min(4, len(state.moveLog)))):
+                reference.undo_move()
+                state.undo_move()
+                compare(reference, state, "undo at ply %d" % ply)
+            continue
+        if rng.random() < 0.1 and not state.in_check():
+            key = state.hash
+            state.make_null_move()
+            if state.hash != state.compute_hash():
+                raise AssertionError("null move at ply %d: zobrist key differs" % ply)
+            state.undo_move()
+            if state.hash != key:
+                raise AssertionError("null move at ply %d: not taken back" % ply)
+            compare(reference, state, "null move at ply %d" % ply)
+        move = rng.choice(moves)
+        reference.make_move(reference_moves[(bitboardEngine.move_start(move), bitboardEngine.move_end(move))])
+        state.make_move(move)
+        compare(reference, state, "move at ply %d" % ply)
+    while state.moveLog:
+        reference.undo_move()
+        state.undo_move()
+        compare(reference, state, "unwinding")
+    if state.hash != start_hash or state.board != bitboardEngine.START_BOARD:
+        raise AssertionError("game did not unwind to the start position")
+
+
+if __name__ == "__main__":
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    rng = random.Random(seed)
+    for game in range(games):
+        fuzz_game(rng)
+    print("%d games round-tripped without differences" % games)
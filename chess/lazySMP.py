@@ -0,0 +1,181 @@
+"""
+Lazy SMP: several processes run the same iterative deepening search on one position and share a single
+transposition table in multiprocessing.shared_memory. They don't coordinate otherwise. Every worker shuffles
+the root moves with its own seed and the odd numbered ones start one iteration deeper, so they wander into
+different parts of the tree and leave entries the others pick up.
+Worker 0 is the one the result is based on. When it finishes the others are stopped, and the deepest
+completed iteration of all workers wins (worker 0 on a tie).
+Usage: move, score, depth, nodes = search(gs.snapshot(), limits) for a one off search. engineWorker keeps a
+WorkerPool instead, whose processes stay alive and attached to its table from one move to the next.
+After a search stats holds worker 0's chessAI statistics (a searchStats.SearchStats dict) with the number of
+workers and the nodes of all of them added.
+"""
+import os
+import random
+import traceback
+from multiprocessing import Event, Process, Queue
+from multiprocessing.shared_memory import SharedMemory
+
+import bitboardEngine
+import chessAI
+import engineProfile
+import transpositionTable
+
+stats = None
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+"""
+Loop of a pool process. It attaches the shared table once and then takes the same commands engineWorker does
+from its own queue:
+    ("position", snapshot)
+    ("go", limits, table_age, search_state, progress_tag)
+    ("quit",)
+and answers every go on result_queue with (worker_id, move, score, depth, nodes, error, stats, search state),
+the last two only from worker 0.
+"""
+
+
+def _worker(worker_id, table_name, commands, result_queue, stop_event, ponder_event, progress_queue):
+    memory = SharedMemory(name=table_name)
+    chessAI.tt = transpositionTable.TranspositionTable(buffer=memory.buf)
+    chessAI.stop_event = stop_event
+    chessAI.ponder_event = ponder_event
+    # only worker 0 reports and logs, the helpers' iterations would repeat or mix up its reports
+    chessAI.progress_queue = progress_queue if worker_id == 0 else None
+    if worker_id:
+        chessAI.stats_log = None
+    gs = bitboardEngine.GameState()
+    try:
+        while True:
+            command = commands.get()
+            if command[0] == "position":
+                gs = bitboardEngine.from_snapshot(command[1])
+            elif command[0] == "go":
+                search_limits, table_age, search_state, chessAI.progress_tag = command[1:]
+                chessAI.set_search_state(search_state)
+                chessAI.tt.age = table_age  # search() moves it on by one, like it does for the table's owner
+                random.seed(worker_id)
+                try:
+                    move, score, depth = chessAI.search(gs, gs.get_valid_moves(), search_limits, 1 + worker_id % 2)
+                except Exception as error:  # report instead of leaving the collector waiting
+                    traceback.print_exc()
+                    result_queue.put((worker_id, None, 0, 0, 0, repr(error), None, None))
+                    continue
+                result_queue.put((worker_id, move, score, depth, chessAI.move_count, None, chessAI.stats.as_dict(),
+                                  chessAI.search_state() if worker_id == 0 else None))
+            elif command[0] == "quit":
+                break
+    finally:
+        chessAI.tt.detach()
+        memory.close()
+        if worker_id == 0 and "counters" in engineProfile.enabled:  # atexit doesn't run in a worker process
+            engineProfile.print_report()
+
+
+"""
+Worker processes searching on the shared table table_name, started when a search first needs them and kept
+for the next ones. stop_event, ponder_event and progress_queue are handed to them once at the start.
+"""
+
+
+class WorkerPool:
+    def __init__(self, table_name, stop_event, ponder_event=None, progress_queue=None):
+        self.table_name = table_name
+        self.stop_event = stop_event
+        self.ponder_event = ponder_event
+        self.progress_queue = progress_queue
+        self.result_queue = Queue()
+        self.processes = []
+        self.commands = []
+
+    """
+    Starts the first workers processes that aren't running, a worker that died is replaced
+    """
+
+    def start(self, workers):
+        for worker_id in range(workers):
+            if worker_id < len(self.processes) and self.processes[worker_id].is_alive():
+                continue
+            commands = Queue()
+            process = Process(target=_worker, args=(worker_id, self.table_name, commands, self.result_queue,
+                                                    self.stop_event, self.ponder_event, self.progress_queue),
+                              daemon=True)
+            process.start()
+            if worker_id < len(self.processes):
+                self.processes[worker_id], self.commands[worker_id] = process, commands
+            else:
+                self.processes.append(process)
+                self.commands.append(commands)
+
+    """
+    Runs the search on workers processes, returns (move, score, depth, nodes of all workers together).
+    table_age is the age the table's owner last searched with, and setting stop_event ends the search early.
+    Every worker starts from the calling process's history and killers, and worker 0's come back into it, so
+    they carry over to the next search like they do in a single process search.
+    Worker 0 reports its iterations to progress_queue tagged with progress_tag like chessAI does.
+    """
+
+    def search(self, snapshot, search_limits, workers=None, table_age=0, progress_tag=None):
+        global stats
+        workers = workers or search_limits.get("workers") or default_workers()
+        self.start(workers)
+        search_state = chessAI.search_state()
+        for commands in self.commands[:workers]:
+            commands.put(("position", snapshot))
+            commands.put(("go", search_limits, table_age, search_state, progress_tag))
+        results = []
+        try:
+            for _ in range(workers):
+                result = self.result_queue.get()
+                results.append(result)
+                if result[0] == 0:  # the main worker is done, the helpers only stop it from getting better
+                    self.stop_event.set()
+        finally:
+            self.stop_event.set()
+        nodes = sum(result[4] for result in results)
+        completed = [result for result in results if result[1] is not None]
+        if not completed:
+            raise RuntimeError("every Lazy SMP worker failed: " + "; ".join(str(result[5]) for result in results))
+        best = max(completed, key=lambda result: (result[3], result[0] == 0))
+        stats = next((result[6] for result in results if result[0] == 0 and result[6]), best[6])
+        state = next((result[7] for result in results if result[7]), None)
+        if state:
+            chessAI.set_search_state(state)
+        stats = dict(stats, workers=workers, total_nodes=nodes)
+        return best[1], best[2], best[3], nodes
+
+    def close(self):
+        for process, commands in zip(self.processes, self.commands):
+            if process.is_alive():
+                commands.put(("quit",))
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        self.processes, self.commands = [], []
+
+
+"""
+One off search on a pool of its own, see WorkerPool.search. table_name reuses an existing shared table instead
+of a fresh one, ponder_event is handed to every worker for ponder searches, see chessAI.iterative_deepening.
+"""
+
+
+def search(snapshot, search_limits, workers=None, table_name=None, table_age=0, stop_event=None,
+           ponder_event=None, progress_queue=None, progress_tag=None):
+    memory = None
+    if table_name is None:
+        megabytes = search_limits.get("hash", chessAI.TT_MEGABYTES)
+        memory = SharedMemory(create=True, size=transpositionTable.table_bytes(megabytes))
+        table_name = memory.name
+    pool = WorkerPool(table_name, stop_event or Event(), ponder_event, progress_queue)
+    try:
+        return pool.search(snapshot, search_limits, workers, table_age, progress_tag)
+    finally:
+        pool.close()
+        if memory is not None:
+            memory.close()
+            memory.unlink()
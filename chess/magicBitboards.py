@@ -0,0 +1,281 @@
+"""
+Magic bitboard attack tables for the sliding pieces.
+A rook or bishop attack set is found with one multiply and one table lookup:
+    table[offset[sq] + ((occupied & mask[sq]) * magic[sq] & FULL) >> shift[sq]]
+The magic numbers below were found once with find_magics (python magicBitboards.py --search prints a new set).
+Filling the attack tables from them still costs a noticeable pause, so the tables are written to TABLE_FILE
+the first time and later runs map that file into memory with mmap and read the tables in place. A file that
+doesn't match this module (truncated, or built from other magic numbers) is built again.
+Run this module directly to (re)build the file.
+"""
+import mmap
+import os
+import random
+import struct
+import sys
+
+FULL = 0xFFFFFFFFFFFFFFFF
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "magic_tables.bin")
+FILE_MAGIC = b"CHMAGIC1"
+SEED = 20240508
+
+ROOK_STEPS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+BISHOP_STEPS = ((-1, -1), (-1, 1), (1, 1), (1, -1))
+
+ROOK_MAGIC_NUMBERS = (
+    0x0080016080400A50, 0x0600120021004084, 0x8180200010008108, 0x2080080104801000,
+    0x0280080002040080, 0x0900085900040002, 0x0400080401100082, 0x0200020100402084,
+    0x1500802040008000, 0x0800401000200040, 0x0009802000700180, 0x0000800800100080,
+    0x0041808014000800, 0x1210808004004200, 0x4011000411004200, 0x4092000080440201,
+    0x2040228000400080, 0x2410024040002002, 0x0090008010802000, 0x1000420022000810,
+    0x0181010004080010, 0x4082008004000280, 0x8080040002010810, 0x4401020024004881,
+    0x7000400180008020, 0x020020014010004A, 0x2000100080802000, 0x400010010021000C,
+    0x000D040080800800, 0x8884000480800200, 0xD080100400080102, 0x8034184200010884,
+    0x0080004000402000, 0x1580882004804001, 0x1200801000802000, 0x0810800800801004,
+    0x0001040082800800, 0x0004000200808004, 0x0962019004000208, 0x0040008402000041,
+    0x0480002000404000, 0x2380500020054000, 0x1441004020010014, 0x8200084200120020,
+    0x0040040008008080, 0x2100040002008080, 0x0202085110040022, 0x800800408902001C,
+    0x000A008046210200, 0x0201824201042600, 0x3860402000170100, 0x8000422008120200,
+    0x8120041008010100, 0x8800401004200801, 0x0008581002011400, 0x00001688E4010200,
+    0x8424A10841D08001, 0x5020104000890021, 0x0201003449412001, 0x0028080410002101,
+    0x003A012008900442, 0x000300840022080D, 0x0006006104008802, 0x0700840048890822
+)
+
+BISHOP_MAGIC_NUMBERS = (
+    0x0040018200820080, 0x0064108085010088, 0x0090010213A28100, 0x0884440088080011,
+    0x0201104040000004, 0x8606829040820020, 0x0044010862100080, 0x0843202210042011,
+    0x0401040818610400, 0x0200109011404080, 0x0840040408820044, 0x0400110418802008,
+    0x00A1220210010100, 0x2280020150880100, 0x8080522110080500, 0x00B0002201046048,
+    0x08080110A0410448, 0x02200448C1040088, 0x0090080104008610, 0xB208012092004000,
+    0x0008805400E00A00, 0x1000400080504004, 0x0440980402011100, 0x0160400200421880,
+    0x1002204111A05210, 0x4090104088010144, 0x4021048010040210, 0x00C4010040200880,
+    0x0001001201004000, 0xC007090202008384, 0x200C290408480220, 0x40640021308A0110,
+    0x0001884000210400, 0x114A222000100108, 0x1004004804810204, 0x2038020080480080,
+    0x4100501040040040, 0x0020040020010080, 0x0270040084004240, 0x1808004101205100,
+    0x4044040240000855, 0x00D20202A0000240, 0x6022030048004102, 0x210003CC24000800,
+    0x0004480104042240, 0x1008200C0C100820, 0x8211100206900040, 0x00100412882C0280,
+    0x0084240108084000, 0x0001008801688002, 0x0080808488210000, 0x0000020C84044008,
+    0x0030000405040200, 0x9628040810A10000, 0x0808A00104010000, 0x4002280808808300,
+    0xC001002084044040, 0x0000002084100820, 0x2101280100A09012, 0x0000800002C20224,
+    0x2031000120220480, 0x0000000585180200, 0x0040222001610100, 0x9090120800548200
+)
+
+"""
+Table building
+"""
+
+
+def _slow_attacks(square, occupied, steps):
+    # plain ray walk, only used to fill the tables
+    row, col = divmod(square, 8)
+    attacks = 0
+    for d_row, d_col in steps:
+        end_row, end_col = row + d_row, col + d_col
+        while 0 <= end_row < 8 and 0 <= end_col < 8:
+            bit = 1 << (end_row * 8 + end_col)
+            attacks |= bit
+            if occupied & bit:
+                break
+            end_row += d_row
+            end_col += d_col
+    return attacks
+
+
+def _relevant_mask(square, steps):
+    # squares whose occupancy changes the attack set, the last square of every ray never matters
+    row, col = divmod(square, 8)
+    mask = 0
+    for d_row, d_col in steps:
+        end_row, end_col = row + d_row, col + d_col
+        while 0 <= end_row + d_row < 8 and 0 <= end_col + d_col < 8:
+            mask |= 1 << (end_row * 8 + end_col)
+            end_row += d_row
+            end_col += d_col
+    return mask
+
+
+def _subsets(mask):
+    # every subset of mask (carry rippler)
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if subset == 0:
+            return
+
+
+def _fill_table(square, steps, magic):
+    mask = _relevant_mask(square, steps)
+    bits = bin(mask).count("1")
+    shift = 64 - bits
+    table = [0] * (1 << bits)
+    for occupied in _subsets(mask):
+        table[((occupied * magic) & FULL) >> shift] = _slow_attacks(square, occupied, steps)
+    return mask, shift, table
+
+
+def _find_magic(square, steps, rng):
+    mask = _relevant_mask(square, steps)
+    bits = bin(mask).count("1")
+    shift = 64 - bits
+    occupancies = list(_subsets(mask))
+    attacks = [_slow_attacks(square, occupied, steps) for occupied in occupancies]
+    while True:
+        magic = rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)  # sparse candidates work best
+        if bin((mask * magic) & 0xFF00000000000000).count("1") < 6:
+            continue
+        table = [None] * (1 << bits)
+        for occupied, attack in zip(occupancies, attacks):
+            index = ((occupied * magic) & FULL) >> shift
+            if table[index] is None:
+                table[index] = attack
+            elif table[index] != attack:  # harmful collision, try the next candidate
+                break
+        else:
+            return magic
+
+
+def find_magics(steps, seed=SEED):
+    rng = random.Random(seed)
+    return [_find_magic(square, steps, rng) for square in range(64)]
+
+
+def _build_tables(steps, magics):
+    masks, shifts, offsets, table = [], [], [], []
+    for square in range(64):
+        mask, shift, attacks = _fill_table(square, steps, magics[square])
+        masks.append(mask)
+        shifts.append(shift)
+        offsets.append(len(table))
+        table.extend(attacks)
+    return masks, list(magics), shifts, offsets, table
+
+
+"""
+File layout, all numbers are little endian unsigned 64 bit:
+    FILE_MAGIC, rook table size, bishop table size,
+    then for rook and bishop: 64 masks, 64 magics, 64 shifts, 64 offsets, followed by both attack tables
+"""
+
+
+def _table_bytes():
+    rook = _build_tables(ROOK_STEPS, ROOK_MAGIC_NUMBERS)
+    bishop = _build_tables(BISHOP_STEPS, BISHOP_MAGIC_NUMBERS)
+    words = [len(rook[4]), len(bishop[4])]
+    for masks, magics, shifts, offsets, _ in (rook, bishop):
+        words += masks + magics + shifts + offsets
+    words += rook[4] + bishop[4]
+    return FILE_MAGIC + struct.pack("<%dQ" % len(words), *words)
+
+
+def build_table_file(path=TABLE_FILE):
+    data = _table_bytes()
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as table_file:
+        table_file.write(data)
+    os.replace(temp_path, path)  # never leave a half written table behind
+    return data
+
+
+"""
+The header words a file built from the magic numbers above must start with (both table sizes, then masks,
+magics, shifts and offsets), without filling the tables
+"""
+
+
+def _expected_header():
+    sizes, words = [], []
+    for steps, magics in ((ROOK_STEPS, ROOK_MAGIC_NUMBERS), (BISHOP_STEPS, BISHOP_MAGIC_NUMBERS)):
+        masks = [_relevant_mask(square, steps) for square in range(64)]
+        shifts = [64 - bin(mask).count("1") for mask in masks]
+        offsets = []
+        size = 0
+        for shift in shifts:
+            offsets.append(size)
+            size += 1 << (64 - shift)
+        sizes.append(size)
+        words += masks + list(magics) + shifts + offsets
+    return sizes + words
+
+
+"""
+Maps the table file, None when it is missing or doesn't match this module: another file magic, another size
+(truncated), other magic numbers or layout, or empty board attacks that aren't the real ones
+"""
+
+
+def _map_table_file(path=TABLE_FILE):
+    try:
+        with open(path, "rb") as table_file:
+            mapped = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    header = _expected_header()
+    rook_size, bishop_size = header[0], header[1]
+    if mapped[:len(FILE_MAGIC)] != FILE_MAGIC or \
+            len(mapped) != len(FILE_MAGIC) + 8 * (len(header) + rook_size + bishop_size):
+        mapped.close()
+        return None
+    words = memoryview(mapped)[len(FILE_MAGIC):].cast("Q")
+    tables = len(header)
+    valid = words[:tables].tolist() == header and \
+        all(words[tables + header[2 + 192 + square]] == _slow_attacks(square, 0, ROOK_STEPS) and
+            words[tables + rook_size + header[2 + 448 + square]] == _slow_attacks(square, 0, BISHOP_STEPS)
+            for square in range(64))
+    words.release()
+    if not valid:
+        mapped.close()
+        return None
+    return mapped
+
+
+def load_tables(path=TABLE_FILE):
+    buffer = _map_table_file(path)
+    if buffer is None:
+        try:
+            buffer = build_table_file(path)
+        except OSError:  # read only install, keep the freshly built tables in memory
+            buffer = _table_bytes()
+    words = memoryview(buffer)[len(FILE_MAGIC):].cast("Q")
+    rook_size, bishop_size = words[0], words[1]
+    position = 2
+    parts = []
+    for _ in range(2):
+        header = []
+        for _ in range(4):
+            header.append(words[position:position + 64].tolist())
+            position += 64
+        parts.append(header)
+    rook_table = words[position:position + rook_size]
+    bishop_table = words[position + rook_size:position + rook_size + bishop_size]
+    return tuple(parts[0]) + (rook_table,), tuple(parts[1]) + (bishop_table,), buffer
+
+
+# keep the mapping alive for as long as the module is loaded, the tables are views into it
+(ROOK_MASKS, ROOK_MAGICS, ROOK_SHIFTS, ROOK_OFFSETS, ROOK_TABLE), \
+    (BISHOP_MASKS, BISHOP_MAGICS, BISHOP_SHIFTS, BISHOP_OFFSETS, BISHOP_TABLE), _mapping = load_tables()
+
+
+def rook_attacks(square, occupied):
+    return ROOK_TABLE[ROOK_OFFSETS[square] +
+                      (((occupied & ROOK_MASKS[square]) * ROOK_MAGICS[square] & FULL) >> ROOK_SHIFTS[square])]
+
+
+def bishop_attacks(square, occupied):
+    return BISHOP_TABLE[BISHOP_OFFSETS[square] +
+                        (((occupied & BISHOP_MASKS[square]) * BISHOP_MAGICS[square] & FULL) >> BISHOP_SHIFTS[square])]
+
+
+def _format_magics(name, magics):
+    lines = ["    " + ", ".join("0x%016X" % magic for magic in magics[i:i + 4]) + "," for i in range(0, 64, 4)]
+    return name + " = (\n" + "\n".join(lines)[:-1] + "\n)"
+
+
+if __name__ == "__main__":
+    if "--search" in sys.argv:
+        print(_format_magics("ROOK_MAGIC_NUMBERS", find_magics(ROOK_STEPS)))
+        print(_format_magics("BISHOP_MAGIC_NUMBERS", find_magics(BISHOP_STEPS)))
+        sys.exit()
+    path = sys.argv[1] if len(sys.argv) > 1 else TABLE_FILE
+    size = len(build_table_file(path))
+    print("wrote %d bytes to %s" % (size, path))
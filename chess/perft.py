@@ -0,0 +1,226 @@
+"""
+Perft (performance test) for bitboardEngine.GameState.
+Counts the leaf nodes of the legal move tree to a fixed depth. Wrong counts point at move generation or
+make/undo bugs, and the nodes per second give a number to track speed between releases.
+Usage:
+    python perft.py                          run the reference suite, one JSON object per position
+    python perft.py --fen "<fen>" --depth 4 --divide   start position when --fen is left out
+    python perft.py --hash 16                perft with a 16 MB table of already counted subtrees
+    python perft.py --legacy --depth 3       count with the original copyEngine.GameState instead
+"""
+import argparse
+import json
+import sys
+import time
+
+import bitboardEngine
+import copyEngine
+
+# positions with known node counts, {depth: nodes}
+SUITE = [
+    {"name": "start position", "fen": bitboardEngine.START_FEN,
+     "nodes": {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}},
+    {"name": "kiwipete", "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     "nodes": {1: 48, 2: 2039, 3: 97862, 4: 4085603}},
+    {"name": "en passant and pins", "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     "nodes": {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}},
+    {"name": "promotions and castling", "fen": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     "nodes": {1: 6, 2: 264, 3: 9467, 4: 422333}},
+    {"name": "promotion captures", "fen": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     "nodes": {1: 44, 2: 1486, 3: 62379, 4: 2103487}},
+    {"name": "middlegame", "fen": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     "nodes": {1: 46, 2: 2079, 3: 89890, 4: 3894594}},
+    {"name": "illegal en passant, rank pin", "fen": "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     "nodes": {6: 1134888}},
+    {"name": "illegal en passant, diagonal pin", "fen": "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     "nodes": {6: 1015133}},
+    {"name": "en passant gives check", "fen": "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     "nodes": {6: 1440467}},
+    {"name": "short castle gives check", "fen": "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     "nodes": {6: 661072}},
+    {"name": "long castle gives check", "fen": "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+     "nodes": {6: 803711}},
+    {"name": "castle rights", "fen": "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     "nodes": {4: 1274206}},
+    {"name": "castling prevented", "fen": "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+     "nodes": {4: 1720476}},
+    {"name": "promote out of check", "fen": "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+     "nodes": {6: 3821001}},
+    {"name": "discovered check", "fen": "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+     "nodes": {5: 1004658}},
+    {"name": "promote to give check", "fen": "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+     "nodes": {6: 217342}},
+    {"name": "underpromote to give check", "fen": "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     "nodes": {6: 92683}},
+    {"name": "self stalemate", "fen": "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+     "nodes": {6: 2217}},
+    {"name": "stalemate and checkmate", "fen": "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+     "nodes": {7: 567584}},
+    {"name": "stalemate and checkmate 2", "fen": "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+     "nodes": {4: 23527}},
+]
+
+"""
+Table of already counted subtrees for hashed perft, a fixed number of slots indexed by the Zobrist key
+"""
+
+
+class PerftTable:
+    ENTRY_BYTES = 100  # rough size of one (key, depth, nodes) tuple slot in CPython
+
+    def __init__(self, megabytes):
+        size = 1
+        while size * 2 * self.ENTRY_BYTES <= megabytes * 1024 * 1024:
+            size *= 2
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.hits = 0
+
+    def get(self, key, depth):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key and entry[1] == depth:
+            self.hits += 1
+            return entry[2]
+        return -1
+
+    def put(self, key, depth, nodes):
+        self.entries[key & self.mask] = (key, depth, nodes)
+
+
+"""
+Counts the leaves below gs at depth, with bulk counting the last ply is counted without making the moves
+"""
+
+
+def perft(gs, depth, bulk=True, table=None):
+    if depth == 0:
+        return 1
+    if bulk and depth == 1:
+        return gs.count_legal_moves()
+    if table is not None:
+        nodes = table.get(gs.hash, depth)
+        if nodes >= 0:
+            return nodes
+    moves = []
+    gs.generate_legal_moves(moves)
+    nodes = 0
+    for move in moves:
+        gs.make_move(move)
+        nodes += perft(gs, depth - 1, bulk, table)
+        gs.undo_move()
+    if table is not None:
+        table.put(gs.hash, depth, nodes)
+    return nodes
+
+
+def legacy_perft(gs, depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        nodes += legacy_perft(gs, depth - 1)
+        gs.undo_move()
+    return nodes
+
+
+def move_name(move):
+    name = bitboardEngine.to_move(move).get_chess_notation().replace("-->", "")
+    if bitboardEngine.is_promotion(move):
+        name += "nbrq"[bitboardEngine.move_flag(move) & 3]
+    return name
+
+
+"""
+Perft split by root move, prints each move with its subtree count
+"""
+
+
+def divide(gs, depth, bulk=True, table=None, out=sys.stdout):
+    moves = []
+    gs.generate_legal_moves(moves)
+    total = 0
+    for move in moves:
+        gs.make_move(move)
+        nodes = perft(gs, depth - 1, bulk, table)
+        gs.undo_move()
+        out.write("%s: %d\n" % (move_name(move), nodes))
+        total += nodes
+    out.write("total: %d\n" % total)
+    return total
+
+
+def run(fen, depth, bulk=True, hash_megabytes=0, expected=None):
+    gs = bitboardEngine.GameState(fen)
+    table = PerftTable(hash_megabytes) if hash_megabytes else None
+    start = time.perf_counter()
+    nodes = perft(gs, depth, bulk, table)
+    seconds = time.perf_counter() - start
+    result = {"fen": fen, "depth": depth, "nodes": nodes, "seconds": round(seconds, 3),
+              "nps": int(nodes / seconds) if seconds > 0 else 0}
+    if table is not None:
+        result["hash_hits"] = table.hits
+    if expected is not None:
+        result["expected"] = expected
+        result["ok"] = nodes == expected
+    return result
+
+
+"""
+Runs every suite position at the deepest known depth whose node count is at most max_nodes
+"""
+
+
+def run_suite(max_nodes, bulk=True, hash_megabytes=0, out=sys.stdout):
+    failures = 0
+    total_nodes = 0
+    total_seconds = 0.0
+    for position in SUITE:
+        depths = [depth for depth, nodes in position["nodes"].items() if nodes <= max_nodes]
+        if not depths:
+            continue
+        depth = max(depths)
+        result = run(position["fen"], depth, bulk, hash_megabytes, position["nodes"][depth])
+        result["name"] = position["name"]
+        out.write(json.dumps(result) + "\n")
+        out.flush()
+        failures += not result["ok"]
+        total_nodes += result["nodes"]
+        total_seconds += result["seconds"]
+    summary = {"summary": True, "failures": failures, "nodes": total_nodes, "seconds": round(total_seconds, 3),
+               "nps": int(total_nodes / total_seconds) if total_seconds > 0 else 0}
+    out.write(json.dumps(summary) + "\n")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft node counts and speed for the chess engine")
+    parser.add_argument("--fen", help="position to count, the reference suite runs when omitted")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--divide", action="store_true", help="print the count below every root move")
+    parser.add_argument("--no-bulk", action="store_true", help="make every leaf move instead of counting")
+    parser.add_argument("--hash", type=int, default=0, metavar="MB", help="hashed perft with a table of MB")
+    parser.add_argument("--max-nodes", type=int, default=1000000, help="suite: deepest depth under this count")
+    parser.add_argument("--legacy", action="store_true", help="count the start position with copyEngine")
+    args = parser.parse_args(argv)
+    bulk = not args.no_bulk
+    if args.legacy:
+        gs = copyEngine.GameState()
+        start = time.perf_counter()
+        nodes = legacy_perft(gs, args.depth)
+        seconds = time.perf_counter() - start
+        print(json.dumps({"engine": "copyEngine", "depth": args.depth, "nodes": nodes, "seconds": round(seconds, 3),
+                          "nps": int(nodes / seconds) if seconds > 0 else 0}))
+        return 0
+    if args.divide:
+        table = PerftTable(args.hash) if args.hash else None
+        divide(bitboardEngine.GameState(args.fen or bitboardEngine.START_FEN), args.depth, bulk, table)
+        return 0
+    if args.fen is None:
+        return 1 if run_suite(args.max_nodes, bulk, args.hash) else 0
+    print(json.dumps(run(args.fen, args.depth, bulk, args.hash)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Material and piece-square scores of the evaluation. bitboardEngine builds its PIECE_SQUARE_TABLE from them when
+it is imported and keeps GameState.pieceSquareScore up to date with it, chessAI.score_board reads that total.
+They live here rather than in chessAI so the engine has the real values whoever imports it first.
+"""
+piece_score = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "p": 1}
+
+knight_position_score = [[1, 1, 1, 1, 1, 1, 1, 1],
+                         [1, 2, 2, 2, 2, 2, 2, 1],
+                         [1, 2, 3, 3, 3, 3, 2, 1],
+                         [1, 2, 3, 4, 4, 3, 2, 1],
+                         [1, 2, 3, 4, 4, 3, 2, 1],
+                         [1, 2, 3, 3, 3, 3, 2, 1],
+                         [1, 2, 2, 2, 2, 2, 2, 1],
+                         [1, 1, 1, 1, 1, 1, 1, 1]]
+
+bishop_position_score = [[4, 3, 2, 1, 1, 2, 3, 4],
+                         [3, 4, 3, 2, 2, 3, 4, 3],
+                         [2, 3, 4, 3, 3, 4, 3, 2],
+                         [1, 2, 3, 4, 4, 3, 2, 1],
+                         [1, 2, 3, 4, 4, 3, 2, 1],
+                         [2, 3, 4, 3, 3, 4, 3, 2],
+                         [3, 4, 3, 2, 2, 3, 4, 3],
+                         [4, 3, 2, 1, 1, 2, 3, 4]]
+
+rook_position_score = [[4, 3, 4, 4, 4, 4, 3, 4],
+                       [4, 4, 4, 4, 4, 4, 4, 4],
+                       [1, 1, 2, 3, 3, 2, 1, 1],
+                       [1, 2, 3, 4, 4, 3, 2, 1],
+                       [1, 2, 3, 4, 4, 3, 2, 1],
+                       [1, 1, 2, 3, 3, 2, 1, 1],
+                       [4, 4, 4, 4, 4, 4, 4, 4],
+                       [4, 3, 4, 4, 4, 4, 3, 4]]
+
+queen_position_score = [[1, 1, 1, 3, 1, 1, 1, 1],
+                        [1, 2, 3, 3, 3, 1, 1, 1],
+                        [1, 4, 3, 3, 3, 4, 2, 1],
+                        [1, 2, 3, 3, 3, 2, 2, 1],
+                        [1, 2, 3, 3, 3, 2, 2, 1],
+                        [1, 4, 3, 3, 3, 4, 2, 1],
+                        [1, 2, 3, 3, 3, 1, 1, 1],
+                        [1, 1, 1, 3, 1, 1, 1, 1]]
+
+white_pawn_position_score = [[8, 8, 8, 8, 8, 8, 8, 8],
+                             [8, 8, 8, 8, 8, 8, 8, 8],
+                             [5, 6, 6, 7, 7, 6, 6, 5],
+                             [2, 3, 3, 5, 5, 3, 3, 2],
+                             [1, 2, 3, 4, 4, 3, 2, 1],
+                             [1, 1, 2, 3, 3, 2, 1, 1],
+                             [1, 1, 1, 0, 0, 1, 1, 1],
+                             [0, 0, 0, 0, 0, 0, 0, 0]]
+
+black_pawn_position_score = [[0, 0, 0, 0, 0, 0, 0, 0],
+                             [1, 1, 1, 0, 0, 1, 1, 1],
+                             [1, 1, 2, 3, 3, 2, 1, 1],
+                             [1, 2, 3, 4, 4, 3, 2, 1],
+                             [2, 3, 3, 5, 5, 3, 3, 2],
+                             [2, 3, 3, 5, 5, 3, 3, 2],
+                             [5, 6, 6, 7, 7, 6, 6, 5],
+                             [8, 8, 8, 8, 8, 8, 8, 8],
+                             [8, 8, 8, 8, 8, 8, 8, 8]]
+
+king_position_scores = [[1, 1.5, 2, 2.5, 2.5, 2, 1.5, 1],
+                        [1.5, 2, 2.5, 3, 3, 2.5, 2, 1.5],
+                        [2, 2.5, 3, 3.5, 3.5, 3, 2.5, 2],
+                        [2.5, 3, 3.5, 4, 4, 3.5, 3, 2.5],
+                        [2.5, 3, 3.5, 4, 4, 3.5, 3, 2.5],
+                        [2, 2.5, 3, 3.5, 3.5, 3, 2.5, 2],
+                        [1.5, 2, 2.5, 3, 3, 2.5, 2, 1.5],
+                        [1, 1.5, 2, 2.5, 2.5, 2, 1.5, 1]]
+
+piece_position_scores = {"N": knight_position_score, "B": bishop_position_score, "Q": queen_position_score,
+                         "R": rook_position_score, "wp": white_pawn_position_score, "bp": black_pawn_position_score,
+                         "K": king_position_scores}
+
+
+"""
+piece_score and piece_position_scores folded into one table per piece, in hundredths of a pawn. piece_names
+are the bitboardEngine.PIECE_NAMES, in piece index order.
+"""
+
+
+def build_piece_square_table(piece_names):
+    table = []
+    for name in piece_names:
+        scores = piece_position_scores[name] if name[1] == "p" else piece_position_scores[name[1]]
+        value = piece_score[name[1]] * 10 if name[1] == "K" else piece_score[name[1]]
+        sign = 1 if name[0] == "w" else -1
+        table.append([sign * round(value * 100 + scores[square >> 3][square & 7] * 10) for square in range(64)])
+    return table
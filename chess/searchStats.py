@@ -0,0 +1,172 @@
+"""
+Statistics of one chessAI search: node counts, speed, time per iteration, effective branching factor, move
+ordering quality, transposition table use and, when part timing is on, the time spent in move generation,
+evaluation and move ordering.
+chessAI.search fills a SearchStats for every search (chessAI.stats), the engineWorker sends it with its answer
+as a dict, and with CHESS_STATS_LOG set to a file path every search appends it to that file as one JSON line.
+Part timing wraps the functions of each part (see chessAI.set_part_timing), which slows the search down a lot,
+so it is off unless CHESS_STATS_TIMING is set. engineProfile's counters go through the same wrappers (timed).
+"""
+import inspect
+import json
+import os
+import time
+
+PARTS = ("movegen", "eval", "ordering")
+part_seconds = dict.fromkeys(PARTS, 0.0)
+part_calls = dict.fromkeys(PARTS, 0)
+_nested = [0.0]  # seconds spent in timed functions called by the one running, so every part counts its own time
+
+
+def reset_parts():
+    for part in part_seconds:
+        part_seconds[part] = 0.0
+        part_calls[part] = 0
+
+
+KEEP = object()  # see timed
+counter_seconds = {}  # engineProfile counters, cumulative time per counter name
+counter_calls = {}
+
+
+def _timed_function(function, part, counter):
+    def wrapper(*args):
+        outer = _nested[0]
+        _nested[0] = 0.0
+        start = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if part:
+                part_seconds[part] += elapsed - _nested[0]
+                part_calls[part] += 1
+                _nested[0] = outer + elapsed
+            else:  # a counter alone leaves the time it saw to the part around it
+                _nested[0] += outer
+            if counter:
+                counter_seconds[counter] += elapsed
+                counter_calls[counter] += 1
+    return wrapper
+
+
+def _timed_generator(function, part, counter):
+    def wrapper(*args):
+        generator = function(*args)
+        if part:
+            part_calls[part] += 1
+        if counter:
+            counter_calls[counter] += 1
+        while True:
+            outer = _nested[0]
+            _nested[0] = 0.0
+            start = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = time.perf_counter() - start
+                if part:
+                    part_seconds[part] += elapsed - _nested[0]
+                    _nested[0] = outer + elapsed
+                else:
+                    _nested[0] += outer
+                if counter:
+                    counter_seconds[counter] += elapsed
+            yield item
+    return wrapper
+
+
+"""
+Returns function (plain or already wrapped by timed) wrapped so its calls are counted and timed, with a single
+wrapper for both uses:
+    part     part timing, in part_seconds and part_calls. Time spent in other timed functions it calls counts
+             for theirs
+    counter  engineProfile counters, in counter_seconds and counter_calls under that name. The time includes
+             the functions it calls
+Either left at KEEP stays what it was, None switches it off, and with both off the plain function comes back.
+Every step of a generator function is timed.
+"""
+
+
+def timed(function, part=KEEP, counter=KEEP):
+    plain = getattr(function, "__wrapped__", function)
+    part = getattr(function, "part", None) if part is KEEP else part
+    counter = getattr(function, "counter", None) if counter is KEEP else counter
+    if not part and not counter:
+        return plain
+    if counter:
+        counter_seconds.setdefault(counter, 0.0)
+        counter_calls.setdefault(counter, 0)
+    wrapper = (_timed_generator if inspect.isgeneratorfunction(plain) else _timed_function)(plain, part, counter)
+    wrapper.__wrapped__ = plain
+    wrapper.part = part
+    wrapper.counter = counter
+    return wrapper
+
+
+class SearchStats:
+    def __init__(self):
+        self.move = None
+        self.score = 0
+        self.depth = 0
+        self.nodes = 0  # main search nodes
+        self.qnodes = 0  # quiescence nodes
+        self.seconds = 0.0
+        self.iterations = []  # (depth, seconds since the start, nodes and qnodes so far) per completed iteration
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt = {}
+        self.pawn_table = {}
+        self.parts = None  # seconds and calls per part, when part timing is on
+
+    def nps(self):
+        return int((self.nodes + self.qnodes) / self.seconds) if self.seconds > 0 else 0
+
+    """
+    Node growth per extra ply: nodes of the last completed iteration over nodes of the one before
+    """
+
+    def effective_branching_factor(self):
+        totals = [nodes for depth, seconds, nodes in self.iterations]
+        counts = [total - before for before, total in zip([0] + totals, totals)]
+        if len(counts) < 2 or not counts[-2]:
+            return 0.0
+        return counts[-1] / counts[-2]
+
+    def as_dict(self):
+        return {"move": self.move, "score": self.score, "depth": self.depth, "nodes": self.nodes,
+                "qnodes": self.qnodes, "seconds": round(self.seconds, 4), "nps": self.nps(),
+                "iterations": [{"depth": depth, "seconds": round(seconds, 4), "nodes": nodes}
+                               for depth, seconds, nodes in self.iterations],
+                "ebf": round(self.effective_branching_factor(), 2), "cutoffs": self.cutoffs,
+                "first_move_cutoff_rate": round(self.first_move_cutoffs / self.cutoffs, 4) if self.cutoffs else 0.0,
+                "tt": self.tt, "pawn_table": self.pawn_table, "parts": self.parts}
+
+
+"""
+One line for the console from a SearchStats.as_dict
+"""
+
+
+def summary(fields):
+    text = "%s depth %d score %+.2f nodes %d+%d q %.2fs %d n/s ebf %.1f first cutoff %.0f%% tt hits %.0f%%" % (
+        fields["move"], fields["depth"], fields["score"], fields["nodes"], fields["qnodes"], fields["seconds"],
+        fields["nps"], fields["ebf"], fields["first_move_cutoff_rate"] * 100, fields["tt"].get("hit_rate", 0) * 100)
+    if fields["parts"]:
+        text += " " + " ".join("%s %.2fs" % (part, fields["parts"][part]["seconds"]) for part in PARTS)
+    return text
+
+
+def write_json_line(path, fields):
+    with open(path, "a") as log:
+        log.write(json.dumps(fields) + "\n")
+
+
+def log_path():
+    return os.environ.get("CHESS_STATS_LOG") or None
+
+
+def timing_requested():
+    return os.environ.get("CHESS_STATS_TIMING", "") not in ("", "0")
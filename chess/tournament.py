@@ -0,0 +1,357 @@
+"""
+Self-play tournament between two engine configurations.
+Every game starts from a position of the opening suite (the openings of bench.SUITE unless --openings names a
+file of FENs, one per line) and the openings are played in pairs with the colors swapped, each game of a pair
+with its own seed for chessAI's root shuffle, so the suite can be played over and over without repeating games.
+A game ends in checkmate or stalemate, or is adjudicated a draw on a threefold repetition, the fifty move rule
+or the move limit.
+The games run on a pool of processes, one game per process at a time, one per core by default. Every finished
+game is appended to the output file as a JSON line right away, so an interrupted tournament loses nothing but
+the games in progress and --resume picks it up again. A crashed worker process (the pool breaks with it) costs
+only the games that were running: they are played again on a fresh pool, one at a time to find the one at
+fault, which is given up on after MAX_ATTEMPTS crashes.
+The first engine is scored against the second with an Elo estimate (95% margin) and a sequential probability
+ratio test of elo0 against elo1, which stops the tournament as soon as one of them is accepted.
+An engine is label:setting=value,... where a setting is a chessAI global (USE_LMR=False, NULL_MOVE_REDUCTION=3)
+or a search limit (depth, nodes, move_time) that overrides the tournament's for that engine.
+Usage:
+    python tournament.py --engine lmr:USE_LMR=True --engine no-lmr:USE_LMR=False
+    python tournament.py --engine deep:depth=4 --engine shallow:depth=3 --games 200 --workers 8
+    python tournament.py --engine new --engine base --resume --out tournament.jsonl
+"""
+import argparse
+import ast
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import bench
+import bitboardEngine
+import chessAI
+import transpositionTable
+
+LIMIT_KEYS = ("depth", "nodes", "move_time")
+# chessAI globals every engine has its own copy of, so the two don't learn from each other's searches
+STATE = ("tt", "pawn_table", "history", "killer_moves", "last_search_ply")
+MAX_ATTEMPTS = 3  # times a game is started before a crash in it is taken as the game's fault
+RESULTS = {"1-0": 1.0, "1/2-1/2": 0.5, "0-1": 0.0}
+
+
+"""
+label:setting=value,... to (label, settings), the label being the whole spec when there is no colon
+"""
+
+
+def parse_engine(spec):
+    label, _, settings_text = spec.partition(":")
+    settings = {}
+    for setting in filter(None, settings_text.split(",")):
+        key, _, value = setting.partition("=")
+        key = key.strip()
+        if key not in LIMIT_KEYS and (not key.isupper() or not hasattr(chessAI, key)):
+            raise ValueError("%s is neither a chessAI setting nor one of %s" % (key, ", ".join(LIMIT_KEYS)))
+        try:
+            settings[key] = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            raise ValueError("%s=%s is not a Python literal" % (key, value))
+    return label, settings
+
+
+def load_openings(path):
+    if path is None:
+        return [(position["name"], position["fen"]) for position in bench.SUITE if position["kind"] == "opening"]
+    with open(path) as openings_file:
+        fens = [line.strip() for line in openings_file if line.strip() and not line.startswith("#")]
+    return [("%s:%d" % (os.path.basename(path), number), fen) for number, fen in enumerate(fens, 1)]
+
+
+class Player:
+    def __init__(self, label, settings, search_limits, megabytes):
+        self.label = label
+        self.settings = {key: value for key, value in settings.items() if key not in LIMIT_KEYS}
+        self.search_limits = dict(search_limits, **{key: settings[key] for key in LIMIT_KEYS if key in settings})
+        # pawn scores are cached per engine too, settings such as DOUBLED_PAWN change what they are
+        self.state = {"tt": transpositionTable.TranspositionTable(megabytes),
+                      "pawn_table": transpositionTable.PawnHashTable(chessAI.PAWN_TABLE_ENTRIES),
+                      "history": [[0] * 4096, [0] * 4096],
+                      "killer_moves": [[0, 0] for _ in range(chessAI.MAX_PLY)], "last_search_ply": -1}
+
+    """
+    Searches gs with this engine's settings and tables swapped into chessAI, returns the move
+    """
+
+    def think(self, gs):
+        saved = {name: getattr(chessAI, name) for name in list(self.settings) + list(STATE)}
+        for name, value in list(self.settings.items()) + list(self.state.items()):
+            setattr(chessAI, name, value)
+        try:
+            return chessAI.search(gs, gs.get_valid_moves(), self.search_limits)[0]
+        finally:
+            self.state = {name: getattr(chessAI, name) for name in STATE}
+            for name, value in saved.items():
+                setattr(chessAI, name, value)
+
+
+"""
+Plays one game in a pool process, returns its record for the output file
+"""
+
+
+def play_game(game, opening, fen, white, black, search_limits, max_moves, megabytes):
+    start = time.perf_counter()
+    random.seed(game)
+    gs = bitboardEngine.GameState(fen)
+    players = [Player(label, settings, search_limits, megabytes) for label, settings in (white, black)]
+    seen = {gs.hash: 1}
+    moves = []
+    while True:
+        if not gs.get_valid_moves():
+            if gs.checkMate:
+                result, reason = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+            else:
+                result, reason = "1/2-1/2", "stalemate"
+            break
+        if seen[gs.hash] >= 3:
+            result, reason = "1/2-1/2", "repetition"
+            break
+        if gs.halfmoveClock >= 100:
+            result, reason = "1/2-1/2", "fifty moves"
+            break
+        if len(moves) >= 2 * max_moves:
+            result, reason = "1/2-1/2", "move limit"
+            break
+        move = players[0 if gs.whiteToMove else 1].think(gs)
+        gs.make_move(move)
+        moves.append(bitboardEngine.to_uci(move))
+        seen[gs.hash] = seen.get(gs.hash, 0) + 1
+    return {"game": game, "opening": opening, "fen": fen, "white": white[0], "black": black[0], "result": result,
+            "reason": reason, "plies": len(moves), "moves": " ".join(moves),
+            "seconds": round(time.perf_counter() - start, 2), "pid": os.getpid()}
+
+
+"""
+Runs the games in pending (argument tuples for play_game, the game number first) on workers processes and
+yields a record for every game as it finishes, failed games as {"game": game, "error": ...}. Games are taken
+from pending only when a process is free, so clearing it stops the tournament after the running games.
+A crashed worker breaks the whole pool and fails every game running in it, without telling which one was at
+fault. Those games become suspects and are played again one at a time on a fresh pool: a game that crashes
+while it runs alone is the culprit and is charged an attempt, the others never are.
+"""
+
+
+def play_games(pending, workers):
+    attempts = {}
+    suspects = deque()
+    while pending or suspects:
+        running = {}  # future: (task, whether it runs alone)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            try:
+                while pending or suspects or running:
+                    if suspects:
+                        if not running:
+                            future = pool.submit(play_game, *suspects[0])  # raises on a broken pool
+                            running[future] = (suspects.popleft(), True)
+                    else:
+                        while pending and len(running) < workers:
+                            future = pool.submit(play_game, *pending[0])
+                            running[future] = (pending.popleft(), False)
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        task, alone = running.pop(future)
+                        try:
+                            yield future.result()
+                        except BrokenProcessPool:
+                            if not alone:
+                                suspects.append(task)
+                                continue
+                            attempts[task[0]] = attempts.get(task[0], 0) + 1
+                            if attempts[task[0]] < MAX_ATTEMPTS:
+                                suspects.append(task)
+                            else:
+                                yield {"game": task[0], "error": "the worker process crashed %d times" %
+                                                                 MAX_ATTEMPTS}
+                        except Exception as error:  # a bug the game runs into, playing it again won't help
+                            yield {"game": task[0], "error": repr(error)}
+            except BrokenProcessPool:  # submit on a pool a crash broke, start a new one
+                suspects.extend(task for task, _ in running.values())
+
+
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def score_elo(score):
+    return -400 * math.log10(1 / score - 1)
+
+
+"""
+Score, score variance per game, Elo difference and its 95% margin of wins, draws and losses. The Elo values
+are None while the score is 0 or 1.
+"""
+
+
+def elo_estimate(wins, draws, losses):
+    games = wins + draws + losses
+    if not games:
+        return 0.5, 0.0, None, None
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if score in (0.0, 1.0):
+        return score, variance, None, None
+    margin = 1.96 * math.sqrt(variance / games)
+    low, high = max(score - margin, 1e-6), min(score + margin, 1 - 1e-6)
+    return score, variance, score_elo(score), (score_elo(high) - score_elo(low)) / 2
+
+
+"""
+Log likelihood ratio of elo1 against elo0 (the normal approximation of the generalized SPRT on the game
+scores) and the decision, "H1" (elo1 accepted), "H0" or None to play on
+"""
+
+
+def sprt(wins, draws, losses, elo0, elo1, alpha, beta):
+    games = wins + draws + losses
+    score, variance, _, _ = elo_estimate(wins, draws, losses)
+    lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+    if not games or not variance:
+        return 0.0, lower, upper, None
+    score0, score1 = expected_score(elo0), expected_score(elo1)
+    llr = (score1 - score0) * (2 * score - score0 - score1) / (2 * variance / games)
+    return llr, lower, upper, "H1" if llr >= upper else "H0" if llr <= lower else None
+
+
+class Standings:
+    def __init__(self, label, elo0, elo1, alpha, beta):
+        self.label = label
+        self.sprt_bounds = (elo0, elo1, alpha, beta)
+        self.wins = self.draws = self.losses = self.errors = 0
+
+    def add(self, record):
+        if "error" in record:
+            self.errors += 1
+            return
+        score = RESULTS[record["result"]]
+        if record["black"] == self.label and record["white"] != self.label:
+            score = 1 - score
+        if score == 1:
+            self.wins += 1
+        elif score == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def decision(self):
+        return sprt(self.wins, self.draws, self.losses, *self.sprt_bounds)[3]
+
+    def as_dict(self):
+        score, _, elo, margin = elo_estimate(self.wins, self.draws, self.losses)
+        llr, lower, upper, decision = sprt(self.wins, self.draws, self.losses, *self.sprt_bounds)
+        return {"engine": self.label, "games": self.wins + self.draws + self.losses, "wins": self.wins,
+                "draws": self.draws, "losses": self.losses, "errors": self.errors, "score": round(score, 4),
+                "elo": round(elo, 1) + 0.0 if elo is not None else None,  # + 0.0 turns -0.0 into 0.0
+                "margin": round(margin, 1) if margin is not None else None,
+                "llr": round(llr, 3), "bounds": [round(lower, 3), round(upper, 3)], "sprt": decision}
+
+
+"""
+The header and the game records of an earlier run in path
+"""
+
+
+def read_results(path):
+    header, records = None, []
+    if os.path.exists(path):
+        with open(path) as results_file:
+            for line in results_file:
+                if line.strip():
+                    record = json.loads(line)
+                    if "tournament" in record:
+                        header = record
+                    else:
+                        records.append(record)
+    return header, records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Self-play tournament between two engine configurations")
+    parser.add_argument("--engine", action="append", default=[], help="label:setting=value,..., given twice")
+    parser.add_argument("--games", type=int, default=1000, help="most games to play when the SPRT doesn't stop")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--nodes", type=int, default=0, help="node limit per move")
+    parser.add_argument("--move-time", type=float, default=0, help="seconds per move")
+    parser.add_argument("--max-moves", type=int, default=150, help="moves per side before a game is a draw")
+    parser.add_argument("--openings", help="file with one FEN per line instead of the bench openings")
+    parser.add_argument("--hash", type=int, default=8, help="transposition table megabytes per engine")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=20.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--out", default="tournament.jsonl", help="file the game records are appended to")
+    parser.add_argument("--resume", action="store_true", help="skip the games already in --out")
+    parser.add_argument("--report", type=int, default=10, help="print the standings every this many games")
+    args = parser.parse_args(argv)
+    if len(args.engine) != 2:
+        parser.error("give --engine twice, the engine to test and the one to test it against")
+    try:
+        engines = [parse_engine(spec) for spec in args.engine]
+    except ValueError as error:
+        parser.error(str(error))
+    if engines[0][0] == engines[1][0]:
+        parser.error("the engines need different labels")
+    openings = load_openings(args.openings)
+    for name, fen in openings:
+        try:
+            bitboardEngine.GameState(fen)
+        except ValueError as error:
+            parser.error("opening %s: %s" % (name, error))
+    search_limits = {"depth": args.depth, "nodes": args.nodes, "move_time": args.move_time}
+    header = {"tournament": args.engine, "search_limits": search_limits, "max_moves": args.max_moves,
+              "openings": [fen for _, fen in openings]}
+    standings = Standings(engines[0][0], args.elo0, args.elo1, args.alpha, args.beta)
+    finished = set()
+    old_header = None
+    if args.resume:
+        old_header, records = read_results(args.out)
+        if old_header is not None and old_header != header:
+            parser.error("%s holds a tournament with other engines, limits or openings" % args.out)
+        for record in records:
+            if "error" not in record:
+                finished.add(record["game"])
+                standings.add(record)
+    elif os.path.exists(args.out):
+        parser.error("%s exists, --resume to continue it or pick another --out" % args.out)
+    pending = deque()
+    for game in range(args.games):
+        if game not in finished:
+            opening, fen = openings[game // 2 % len(openings)]
+            white, black = engines if game % 2 == 0 else engines[::-1]
+            pending.append((game, opening, fen, white, black, search_limits, args.max_moves, args.hash))
+    if standings.decision() is not None:  # the resumed games already decided it
+        pending.clear()
+    played = 0
+    with open(args.out, "a") as results_file:
+        if old_header is None:
+            results_file.write(json.dumps(header) + "\n")
+        for record in play_games(pending, args.workers):
+            results_file.write(json.dumps(record) + "\n")
+            results_file.flush()
+            standings.add(record)
+            played += 1
+            if standings.decision() is not None:
+                pending.clear()  # the running games are still recorded
+            if played % args.report == 0:
+                print(json.dumps(standings.as_dict()))
+                sys.stdout.flush()
+    print(json.dumps(dict(standings.as_dict(), final=True)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Fixed size transposition table for the chessAI search, keyed by the Zobrist key of bitboardEngine.GameState.
+The table is two flat array("Q") lists instead of a dict, so its memory is fixed by the size it was made with.
+Every slot is two words: the key xor the data word, and the data word itself. A probe only matches when
+both agree, which also rejects a slot that was half written by someone else.
+Slots come in buckets of two: the first keeps the deepest entry of the current search, the second always
+takes whatever the first one turned down.
+The table can also live in a buffer shared between processes (lazySMP), there is no lock: a slot written by two
+processes at once simply stops matching its key.
+Data word layout:
+    bits 0-23 best move (packed bitboardEngine move, 0 for none), bits 24-47 score + SCORE_OFFSET,
+    bits 48-55 depth, bits 56-57 bound, bits 58-63 age of the search that stored it
+PawnHashTable is the same idea for pawn structure scores, one key and one score per slot.
+"""
+from array import array
+
+EXACT = 1
+LOWER = 2  # the score is at least this, the search failed high
+UPPER = 3  # the score is at most this, the search failed low
+
+SLOT_BYTES = 16
+SCORE_OFFSET = 1 << 23
+MAX_AGE = 63
+DEFAULT_MEGABYTES = 16
+
+
+def entry_move(data):
+    return data & 0xFFFFFF
+
+
+def entry_score(data):
+    return (data >> 24 & 0xFFFFFF) - SCORE_OFFSET
+
+
+def entry_depth(data):
+    return data >> 48 & 0xFF
+
+
+def entry_bound(data):
+    return data >> 56 & 3
+
+
+"""
+Bytes of the buffer a table of megabytes uses, the largest power of two bucket count that fits
+"""
+
+
+def table_bytes(megabytes):
+    buckets = 1
+    while buckets * 4 * SLOT_BYTES <= megabytes * 1024 * 1024:
+        buckets *= 2
+    return buckets * 2 * SLOT_BYTES
+
+
+class TranspositionTable:
+    def __init__(self, megabytes=DEFAULT_MEGABYTES, buffer=None):
+        self.age = 0
+        if buffer is None:
+            self.resize(megabytes)
+        else:
+            self.attach(buffer)
+
+    """
+    Reallocates the table with the largest power of two bucket count that fits in megabytes, clearing it
+    """
+
+    def resize(self, megabytes):
+        size = table_bytes(megabytes)
+        self.mask = size // (2 * SLOT_BYTES) - 1
+        self.keys = array("Q", bytes(size // 2))
+        self.data = array("Q", bytes(size // 2))
+        self.megabytes = megabytes
+        self.shared = False
+        self.reset_stats()
+
+    """
+    Uses buffer (for example multiprocessing.shared_memory.SharedMemory.buf, table_bytes long) for the slots,
+    the key words in its first half and the data words in the second
+    """
+
+    def attach(self, buffer):
+        words = memoryview(buffer).cast("Q")
+        half = len(words) // 2
+        self.mask = half // 2 - 1
+        self.keys = words[:half]
+        self.data = words[half:]
+        self.megabytes = len(buffer) / (1024 * 1024)
+        self.shared = True
+        self.reset_stats()
+
+    """
+    Lets go of the shared buffer so it can be closed. What is left is a minimal private table, resize it before
+    searching with it again
+    """
+
+    def detach(self):
+        if self.shared:
+            self.keys.release()
+            self.data.release()
+            self.resize(0)
+
+    def clear(self):
+        if self.shared:
+            self.keys[:] = array("Q", bytes(len(self.keys) * 8))
+            self.data[:] = array("Q", bytes(len(self.data) * 8))
+            self.reset_stats()
+        else:
+            self.resize(self.megabytes)
+        self.age = 0
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+
+    """
+    Called once per move before searching, entries from older searches are replaced first
+    """
+
+    def new_search(self):
+        self.age = (self.age + 1) & MAX_AGE
+        self.reset_stats()
+
+    """
+    Returns the data word stored for key, or 0 when the position isn't in the table
+    """
+
+    def probe(self, key):
+        self.probes += 1
+        slot = (key & self.mask) << 1
+        data = self.data[slot]
+        if data and self.keys[slot] ^ data == key:
+            self.hits += 1
+            return data
+        data = self.data[slot + 1]
+        if data and self.keys[slot + 1] ^ data == key:
+            self.hits += 1
+            return data
+        return 0
+
+    def store(self, key, depth, score, bound, move):
+        if score > SCORE_OFFSET - 1:
+            score = SCORE_OFFSET - 1
+        elif score < -SCORE_OFFSET:
+            score = -SCORE_OFFSET
+        data = move | (score + SCORE_OFFSET) << 24 | depth << 48 | bound << 56 | self.age << 58
+        slot = (key & self.mask) << 1
+        old = self.data[slot]
+        # the depth preferred slot takes same position updates, deeper or equal searches and anything stale
+        if self.keys[slot] ^ old == key or old >> 48 & 0xFF <= depth or old >> 58 != self.age:
+            if not move and self.keys[slot] ^ old == key:  # keep the best move of an earlier search
+                data |= old & 0xFFFFFF
+        else:
+            slot += 1
+            old = self.data[slot]
+        if old and self.keys[slot] ^ old != key:
+            self.collisions += 1  # another position's entry is replaced
+        self.keys[slot] = key ^ data
+        self.data[slot] = data
+        self.stores += 1
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    """
+    Permille of the first thousand slots used by the current search, the UCI hashfull number
+    """
+
+    def hashfull(self):
+        sample = min(1000, len(self.data))
+        age = self.age
+        return sum(1 for data in self.data[:sample] if data and data >> 58 == age) * 1000 // sample
+
+    def stats(self):
+        return {"probes": self.probes, "hits": self.hits, "stores": self.stores, "collisions": self.collisions,
+                "hit_rate": round(self.hit_rate(), 4), "hashfull": self.hashfull()}
+
+
+"""
+Direct mapped cache of pawn structure scores keyed by GameState.pawnHash. A store always replaces the slot,
+pawn structures change slowly so the most recent ones are the ones worth keeping.
+"""
+
+
+class PawnHashTable:
+    def __init__(self, entries):
+        size = 1
+        while size * 2 <= entries:
+            size *= 2
+        self.mask = size - 1
+        self.keys = array("Q", bytes(8 * size))
+        self.scores = array("d", bytes(8 * size))
+        self.used = array("b", bytes(size))
+        self.clear()
+
+    def clear(self):
+        self.used[:] = array("b", bytes(len(self.used)))
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def probe(self, key):
+        self.probes += 1
+        slot = key & self.mask
+        if self.used[slot] and self.keys[slot] == key:
+            self.hits += 1
+            return self.scores[slot]
+        return None
+
+    def store(self, key, score):
+        slot = key & self.mask
+        if self.used[slot] and self.keys[slot] != key:
+            self.evictions += 1
+        self.keys[slot] = key
+        self.scores[slot] = score
+        self.used[slot] = 1
+        self.stores += 1
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        return {"probes": self.probes, "hits": self.hits, "stores": self.stores, "evictions": self.evictions,
+                "hit_rate": round(self.hit_rate(), 4)}